@@ -0,0 +1,49 @@
+" Returns all g:citation_vim_* variables, so the context loads in one call
+function! citation#context() abort
+  return filter(copy(g:), 'v:key =~# "^citation_vim_"')
+endfunction
+
+" Runs in the remote plugin host, which holds the libraries Denite loaded
+function! citation#reload() abort
+  call _citation_reload()
+endfunction
+
+" Lists citations in the buffer that match no entry, or several, in quickfix
+function! citation#check_buffer() abort
+  let entries = _citation_check_buffer()
+  let bufnr = bufnr('%')
+  call map(entries, 'extend(v:val, {"bufnr": bufnr})')
+  call setqflist([], ' ', {'title': 'CitationCheckBuffer', 'items': entries})
+  if empty(entries)
+    cclose
+    echo 'All citations resolved'
+  else
+    copen
+  endif
+endfunction
+
+" Writes the entries cited in the buffer, as they are in the bibtex file
+function! citation#export_bib(out_file) abort
+  let missing = _citation_export_bib(fnamemodify(a:out_file, ':p'))
+  echo 'Wrote ' . a:out_file
+  if !empty(missing)
+    echohl WarningMsg
+    echo 'Not found: ' . join(missing, ', ')
+    echohl None
+  endif
+endfunction
+
+" Loads the library in the remote plugin host, so the picker opens against it
+function! citation#warmup() abort
+  call _citation_warmup()
+endfunction
+
+" Refreshes the resident library after one of its bibtex files was written
+function! citation#refresh_file(path) abort
+  call _citation_refresh_file(a:path)
+endfunction
+
+" The stats of the remote plugin host, where Denite loads the library
+function! citation#stats() abort
+  echo _citation_stats()
+endfunction
@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks for citation.vim.
+
+    python -m benchmarks generate library.bib --entries 10000
+    python -m benchmarks run --entries 1000 10000 --output results.json
+    python -m benchmarks compare baseline.json results.json
+    python -m benchmarks conformance
+    python -m benchmarks startup
+    python -m benchmarks memory --entries 100000
+    python -m benchmarks zotero --entries 10000 --changed 100
+"""
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import sys
+
+from benchmarks import harness, memory, startup, zotero
+from benchmarks.generate import generate
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("generate", help="write a synthetic .bib file")
+    command.add_argument("output")
+    command.add_argument("--entries", type=int, default=10000)
+    command.add_argument("--seed", type=int, default=0)
+    command.add_argument("--duplicates", type=float, default=0.02)
+
+    command = commands.add_parser("run", help="time each phase")
+    command.add_argument("--entries", type=int, nargs="+", default=[1000, 10000])
+    command.add_argument("--parser", choices=["fast", "pybtex"], default="fast")
+    command.add_argument("--repeats", type=int, default=3)
+    command.add_argument("--seed", type=int, default=0)
+    command.add_argument("--workdir")
+    command.add_argument("--output", help="JSON results file, default stdout")
+
+    command = commands.add_parser("compare", help="flag regressions between runs")
+    command.add_argument("baseline")
+    command.add_argument("current")
+    command.add_argument("--threshold", type=float, default=0.1)
+
+    command = commands.add_parser(
+        "conformance", help="compare the fast parser against pybtex"
+    )
+    command.add_argument(
+        "files", nargs="*", help="bibtex files, the fixtures of benchmarks/fixtures"
+    )
+
+    command = commands.add_parser(
+        "startup", help="check the modules a warm open imports"
+    )
+    command.add_argument("--entries", type=int, default=1000)
+    command.add_argument("--workdir")
+
+    command = commands.add_parser(
+        "memory", help="resident memory of a session opening each sub-source"
+    )
+    command.add_argument("--entries", type=int, default=100000)
+    command.add_argument("--workdir")
+
+    command = commands.add_parser(
+        "zotero", help="read, open and refresh a synthetic Zotero database"
+    )
+    command.add_argument("--entries", type=int, default=10000)
+    command.add_argument("--changed", type=int, default=100)
+    command.add_argument("--workdir")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        generate(args.output, args.entries, args.seed, args.duplicates)
+        return 0
+
+    if args.command == "run":
+        results = harness.run(
+            args.entries, args.parser, args.repeats, args.seed, args.workdir
+        )
+        output = json.dumps(results, indent=2, sort_keys=True)
+        if args.output:
+            with open(args.output, "w") as out_file:
+                out_file.write(output + "\n")
+        else:
+            print(output)
+        return 0
+
+    if args.command == "compare":
+        with open(args.baseline) as in_file:
+            baseline = json.load(in_file)
+        with open(args.current) as in_file:
+            current = json.load(in_file)
+        rows = harness.compare(baseline, current, args.threshold)
+        for size, phase, before, after, ratio, regressed in rows:
+            flag = "  REGRESSION" if regressed else ""
+            print(
+                "%8s %-26s %10.4fs %10.4fs %6.2fx%s"
+                % (size, phase, before, after, ratio, flag)
+            )
+        return 1 if any(row[-1] for row in rows) else 0
+
+    if args.command == "conformance":
+        failed = False
+        for bibtex_file in args.files or harness.fixture_files():
+            differences = harness.compare_parsers(bibtex_file)
+            for key, field, expected, actual in differences:
+                print(
+                    "%s: %s %s: %r != %r" % (bibtex_file, key, field, expected, actual)
+                )
+            print("%s: %d differences" % (bibtex_file, len(differences)))
+            failed = failed or bool(differences)
+        return 1 if failed else 0
+
+    if args.command == "startup":
+        result = startup.check(args.entries, args.workdir)
+        for import_us, name in result["slowest"]:
+            print("%8dus %s" % (import_us, name))
+        print(
+            "%d modules imported in %.1fms"
+            % (len(result["imported"]), result["import_us"] / 1000.0)
+        )
+        for name in result["forbidden"]:
+            print("FORBIDDEN %s" % name)
+        return 1 if result["forbidden"] else 0
+
+    if args.command == "memory":
+        print("%-12s %10s %10s" % ("step", "resident", "unshared"))
+        for step, resident, unshared in memory.measure(args.entries, args.workdir):
+            print("%-12s %8.1fMB %8.1fMB" % (step, resident / 1e6, unshared / 1e6))
+        return 0
+
+    if args.command == "zotero":
+        result = zotero.check(args.entries, args.changed, args.workdir)
+        for phase in ["full_read", "cached_open", "refresh"]:
+            print("%-12s %10.4fs" % (phase, result[phase]))
+        print("retitled     %s" % result["retitled"])
+        print("kept keys    %d" % result["kept_keys"])
+        print("shared keys  %d" % result["shared_keys"])
+        for key, field in result["differences"]:
+            print("DIFFERENT %s %s" % (key, field))
+        failed = result["differences"] or result["shared_keys"]
+        return 1 if failed or not result["length_matches"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+import random
+
+FIRST_NAMES = """
+    Alice Bruno Chen Dmitri Elena Fatima Gustavo Hiroshi Ingrid Jamal Katarzyna
+    Lars Mei Nikolai Olga Priya Quentin Rosa Sven Tomás Uma Viktor Wen Yusuf Zoë
+""".split()
+LAST_NAMES = """
+    Smith Müller Wang Ivanova García Nguyen Okafor Kowalski Johansson Rossi
+    Tanaka Dubois Schneider Kim Haddad Silva O'Brien Novak Fischer Petrov
+    Andersen Costa Yamamoto Patel
+""".split()
+VON_PARTS = ["van", "von", "de", "van der", "de la"]
+WORDS = """
+    analysis adaptive bayesian bounds causal coherent dynamics efficient
+    emergent estimation evolution framework graph inference learning linear
+    model network neural nonlinear optimal protein quantum random robust
+    sampling scalable spectral stochastic structure systems theory topological
+    transport uncertainty variational wave
+""".split()
+JOURNALS = [
+    ("nature", "Nature"),
+    ("science", "Science"),
+    ("prl", "Physical Review Letters"),
+    ("jmlr", "Journal of Machine Learning Research"),
+    ("pnas", "Proceedings of the National Academy of Sciences"),
+    ("neuron", "Neuron"),
+]
+GROUPS = ["Thesis", "Reading group", "To read", "Grant", "Teaching", "Review"]
+TYPES = ["article"] * 6 + ["book", "inproceedings", "phdthesis", "misc"]
+
+
+def generate(path, entries, seed=0, duplicates=0.02):
+    """
+    Writes a deterministic synthetic bibtex file with `entries` entries to
+    path. A `duplicates` fraction of entries repeat an earlier entry under a
+    new key.
+    """
+    rand = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as out_file:
+        for macro, journal in JOURNALS:
+            out_file.write('@string{%s = "%s"}\n' % (macro, journal))
+        out_file.write("\n")
+        written = []
+        for number in range(entries):
+            if written and rand.random() < duplicates:
+                fields = dict(rand.choice(written))
+            else:
+                fields = _entry_fields(rand, number)
+                written.append(fields)
+            key = "%s%s%s%d" % (
+                fields["_surname"].lower().replace("'", ""),
+                fields["_year"],
+                fields["_word"],
+                number,
+            )
+            out_file.write(_format_entry(fields, key))
+
+
+def _entry_fields(rand, number):
+    authors = [_author(rand) for _ in range(rand.choice([1, 1, 2, 3, 4, 6, 12]))]
+    title_words = rand.sample(WORDS, rand.randint(3, 10))
+    abstract = [rand.choice(WORDS) for _ in range(rand.randint(40, 250))]
+    year = rand.randint(1950, 2026)
+    fields = {
+        "_type": rand.choice(TYPES),
+        "_surname": authors[0][1],
+        "_year": year,
+        "_word": title_words[0],
+        "author": " and ".join(_format_author(rand, author) for author in authors),
+        "title": "{%s}" % " ".join(title_words).capitalize(),
+        "year": str(year) if rand.random() < 0.7 else None,
+        "date": "{%d-%02d-%02d}" % (year, rand.randint(1, 12), rand.randint(1, 28)),
+        "journal": rand.choice(JOURNALS)[0],
+        "volume": str(rand.randint(1, 400)),
+        "number": str(rand.randint(1, 12)),
+        "pages": '"%d--%d"' % (rand.randint(1, 500), rand.randint(501, 999)),
+        "doi": "{10.%d/%s.%d}" % (rand.randint(1000, 9999), title_words[0], number),
+        "keywords": "{%s}" % ", ".join(rand.sample(WORDS, rand.randint(0, 5))),
+        "abstract": "{%s}" % " ".join(abstract),
+        "file": "{Full Text PDF:files/%d/%s.pdf:application/pdf}"
+        % (number, title_words[0]),
+        "url": "{https://example.org/%d}" % number if rand.random() < 0.3 else None,
+        "langid": "{english}" if rand.random() < 0.5 else None,
+        "groups": (
+            "{%s}" % ", ".join(rand.sample(GROUPS, rand.randint(1, 2)))
+            if rand.random() < 0.4
+            else None
+        ),
+    }
+    return fields
+
+
+def _author(rand):
+    return (rand.choice(FIRST_NAMES), rand.choice(LAST_NAMES))
+
+
+def _format_author(rand, author):
+    first, last = author
+    if rand.random() < 0.05:
+        return "%s %s %s" % (first, rand.choice(VON_PARTS), last)
+    return "%s, %s" % (last, first)
+
+
+def _format_entry(fields, key):
+    lines = ["@%s{%s," % (fields["_type"], key)]
+    for name, value in fields.items():
+        if name.startswith("_") or value is None:
+            continue
+        if name == "author":
+            value = "{%s}" % value
+        lines.append("  %s = %s," % (name, value))
+    lines.append("}\n\n")
+    return "\n".join(lines)
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+import gc
+import glob
+import io
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from os.path import abspath, dirname, join
+
+ROOT = dirname(dirname(abspath(__file__)))
+# Bibtex files the fast parser is checked against pybtex on by default
+FIXTURES = join(ROOT, "benchmarks", "fixtures")
+sys.path.insert(0, join(ROOT, "python"))
+
+from citation_vim import cli
+from citation_vim import library as resident
+from citation_vim.bibtex.parser import BibtexParser
+from citation_vim.cache import FIELDS, fingerprint, get_cache_file
+from citation_vim.cache import read_cache, write_cache
+from citation_vim.check import KeyIndex, check_lines
+from citation_vim.search import SearchIndex
+from citation_vim.sorting import MODES as SORT_MODES
+from benchmarks.generate import generate
+from benchmarks.stub import StubVim, load_source
+from benchmarks.stub import gather as gather_all
+
+
+def best_of(repeats, function):
+    """
+    Returns: The fastest of `repeats` timed calls, in seconds.
+    """
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(sizes, parser="fast", repeats=3, seed=0, workdir=None):
+    """
+    Returns: Timings of each phase for synthetic libraries of the given
+    sizes, as a JSON-serialisable dict.
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix="citation_vim_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    results = {}
+    for size in sizes:
+        bibtex_file = join(workdir, "library_%d.bib" % size)
+        if not os.path.isfile(bibtex_file):
+            generate(bibtex_file, size, seed)
+        cache_path = join(workdir, "cache_%d" % size)
+        os.makedirs(cache_path, exist_ok=True)
+        results[str(size)] = run_phases(bibtex_file, cache_path, parser, repeats)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "parser": parser,
+            "repeats": repeats,
+            "seed": seed,
+            "time": time.time(),
+        },
+        "results": results,
+    }
+
+
+def run_phases(bibtex_file, cache_path, parser_name, repeats):
+    """
+    Returns: A dict of phase name to seconds for one bibtex file.
+    """
+    Source = load_source()
+    variables = {
+        "citation_vim_mode": "bibtex",
+        "citation_vim_bibtex_file": bibtex_file,
+        "citation_vim_cache_path": cache_path,
+        "citation_vim_review_directory": "",
+        "citation_vim_parser": parser_name,
+    }
+    context = dict(Source(StubVim(variables)).vars)
+    context.update(
+        {
+            "bibtex_file": bibtex_file,
+            "cache_path": cache_path,
+            "parser": parser_name,
+            "source_field": "title",
+        }
+    )
+    timings = {"bytes": os.path.getsize(bibtex_file)}
+
+    parser = BibtexParser(context)
+    timings["read_file"] = best_of(repeats, lambda: parser._read_file(bibtex_file))
+    bib_data = parser._read_file(bibtex_file)
+    timings["build_items"] = best_of(repeats, lambda: parser.build_items(bib_data))
+    timings["load"] = best_of(repeats, parser.load)
+    gc.collect()
+    tracemalloc.start()
+    items = parser.load()
+    gc.collect()
+    timings["items_bytes"] = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    timings["entries"] = len(items)
+    timings["combine"] = best_of(repeats, lambda: [item.combine() for item in items])
+    timings["describe"] = best_of(
+        repeats, lambda: [item.describe(context) for item in items]
+    )
+
+    library = parser.update(None)
+    settings = fingerprint(context)
+    cache_file = get_cache_file(context)
+    timings["write_cache"] = best_of(
+        repeats, lambda: write_cache(cache_file, library, settings)
+    )
+    timings["cache_bytes"] = os.path.getsize(cache_file)
+
+    def read_keys():
+        return [item.key for item in read_cache(cache_file, settings)["items"]]
+
+    timings["read_cache"] = best_of(repeats, read_keys)
+
+    def search():
+        # A fresh index each time, so queries aren't answered from its memo
+        cached = read_cache(cache_file, settings)
+        index = SearchIndex(cached["items"], [(cached["index"], 0)])
+        for query in queries:
+            index.match(query)
+
+    queries = [item.key[:5] for item in items[:: max(1, len(items) // 20)]]
+    timings["search"] = best_of(repeats, search)
+
+    cached_items = read_cache(cache_file, settings)["items"]
+    timings["key_index"] = best_of(repeats, lambda: KeyIndex(cached_items))
+    key_index = KeyIndex(cached_items)
+    document = citing_document(items, 1000)
+    timings["check_lines"] = best_of(repeats, lambda: check_lines(document, key_index))
+
+    def sort_modes():
+        # The order of every mode from a fresh map, as after switching modes
+        sort_keys = read_cache(cache_file, settings)["sort_keys"]
+        for mode in SORT_MODES:
+            list(sort_keys.order(mode))
+
+    timings["sort_modes"] = best_of(repeats, sort_modes)
+
+    def gather():
+        source = Source(StubVim(variables))
+        source_context = {"args": []}
+        source.on_init(source_context)
+        return gather_all(source, source_context)
+
+    def gather_cold():
+        # Drop the resident libraries and the cache, as in a fresh session
+        resident._libraries.clear()
+        os.remove(cache_file)
+        gather()
+
+    def gather_cached():
+        resident._libraries.clear()
+        gather()
+
+    timings["gather_candidates_cold"] = best_of(repeats, gather_cold)
+    timings["gather_candidates_cached"] = best_of(repeats, gather_cached)
+    timings["gather_candidates_warm"] = best_of(repeats, gather)
+
+    def cli_query_all():
+        # Every entry as TSV, as `python -m citation_vim query` from a warm cache
+        resident._libraries.clear()
+        library = cli.get_cli_library(variables)
+        rows = cli.query_rows(library, [], cli.DEFAULT_FIELDS)
+        cli.write_rows(io.StringIO(), rows, "tsv")
+
+    timings["cli_query_all"] = best_of(repeats, cli_query_all)
+    return timings
+
+
+def citing_document(items, citations):
+    """
+    Returns: The lines of a document with `citations` LaTeX and Pandoc
+    citations of the items, one in ten of them undefined.
+    """
+    lines = []
+    step = max(1, len(items) // citations)
+    for number, item in enumerate(items[::step][:citations]):
+        key = item.key if number % 10 else "missing%d" % number
+        if number % 2:
+            lines.append("As shown by \\citet[p. 4]{%s}, the text goes on." % key)
+        else:
+            lines.append("As shown [see @%s, p. 4; -@%s], it goes on." % (key, key))
+        lines.append("")
+    return lines
+
+
+def compare(baseline, current, threshold=0.1, min_delta=0.001):
+    """
+    Returns: An array of (size, phase, baseline, current, ratio, regressed)
+    for the phases timed in both runs. A phase regressed if it is more than
+    `threshold` slower and by at least `min_delta` seconds.
+    """
+    rows = []
+    for size, phases in sorted(current["results"].items(), key=lambda i: int(i[0])):
+        if size not in baseline["results"]:
+            continue
+        for phase, seconds in phases.items():
+            before = baseline["results"][size].get(phase)
+            if before is None or not isinstance(seconds, float):
+                continue
+            ratio = seconds / before if before else float("inf")
+            regressed = ratio > 1 + threshold and seconds - before >= min_delta
+            rows.append((size, phase, before, seconds, ratio, regressed))
+    return rows
+
+
+def fixture_files():
+    """
+    Returns: The paths of the bibtex files in FIXTURES, sorted.
+    """
+    return sorted(glob.glob(join(FIXTURES, "*.bib")))
+
+
+def compare_parsers(bibtex_file, et_al_limit=5):
+    """
+    Returns: An array of (key, field, pybtex value, fast value) for every
+    field where the fast scanner disagrees with pybtex.
+    """
+    context = {"bibtex_file": bibtex_file, "et_al_limit": et_al_limit}
+    results = []
+    for name in ("pybtex", "fast"):
+        context["parser"] = name
+        items = BibtexParser(context).load()
+        results.append(dict((item.key, item) for item in items))
+    expected, actual = results
+    differences = []
+    for key in expected:
+        if key not in actual:
+            differences.append((key, "key", key, None))
+            continue
+        for field in FIELDS:
+            left = getattr(expected[key], field)
+            right = getattr(actual[key], field)
+            if left != right:
+                differences.append((key, field, left, right))
+    for key in actual:
+        if key not in expected:
+            differences.append((key, "key", None, key))
+    return differences
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from os.path import join
+
+from benchmarks.generate import generate
+from benchmarks.stub import ROOT
+
+# Opens the Denite source in a fresh interpreter for each step, printing the
+# resident set size after it as a JSON line.
+OPEN_SOURCES = """
+import json, os, sys
+sys.path.insert(0, {root!r})
+from benchmarks.stub import StubVim, gather, load_source
+
+
+def rss():
+    # Resident, and resident less the shared pages of the mapped cache file
+    with open("/proc/self/statm") as in_file:
+        resident, shared = [int(n) for n in in_file.read().split()[1:3]]
+    return [n * os.sysconf("SC_PAGE_SIZE") for n in (resident, resident - shared)]
+
+
+print(json.dumps(["start"] + rss()), flush=True)
+Source = load_source()
+for args in {steps!r}:
+    source = Source(StubVim({variables!r}))
+    context = {{"args": list(args)}}
+    source.on_init(context)
+    candidates = gather(source, context)
+    print(json.dumps([":".join(args) or "open"] + rss()), flush=True)
+"""
+
+# Sources opened in turn, as a session would.
+STEPS = [[], ["title"], ["author"], ["combined"], ["abstract"], []]
+
+
+def measure(entries=100000, workdir=None, steps=STEPS):
+    """
+    Returns: An array of (step, resident bytes, unshared resident bytes) of
+    a session opening each of the steps, from a current cache.
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix="citation_vim_memory_")
+    os.makedirs(workdir, exist_ok=True)
+    bibtex_file = join(workdir, "library_%d.bib" % entries)
+    if not os.path.isfile(bibtex_file):
+        generate(bibtex_file, entries)
+    variables = {
+        "citation_vim_mode": "bibtex",
+        "citation_vim_bibtex_file": bibtex_file,
+        "citation_vim_cache_path": workdir,
+        "citation_vim_parser": "fast",
+    }
+    # Write the cache first, the session is measured from a current cache
+    _run(variables, [[]])
+    return _run(variables, steps)
+
+
+def _run(variables, steps):
+    script = OPEN_SOURCES.format(root=ROOT, variables=variables, steps=steps)
+    process = subprocess.run(
+        [sys.executable, "-c", script],
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    return [tuple(json.loads(line)) for line in process.stdout.splitlines()]
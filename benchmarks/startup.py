@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+import os
+import subprocess
+import sys
+import tempfile
+from os.path import join
+
+from benchmarks.generate import generate
+from benchmarks.stub import ROOT
+
+# Modules a warm open, with a current cache, must not import.
+FORBIDDEN = (
+    "pybtex",
+    "citation_vim.bibtex.parser",
+    "citation_vim.bibtex.scanner",
+    "concurrent.futures",
+    "multiprocessing",
+    "tempfile",
+    "json",
+)
+
+# Opens the Denite source once in a fresh interpreter, then prints the
+# modules the open imported.
+OPEN_SOURCE = """
+import sys
+sys.path.insert(0, {root!r})
+from benchmarks.stub import StubVim, gather, load_source
+before = set(sys.modules)
+Source = load_source()
+source = Source(StubVim({variables!r}))
+context = {{"args": []}}
+source.on_init(context)
+gather(source, context)
+imported = sorted(set(sys.modules) - before)
+print("\\n".join(imported))
+"""
+
+
+def open_source(variables):
+    """
+    Returns: (modules imported by an open in a new interpreter, a dict of
+    module name to self import time in microseconds from -X importtime).
+    """
+    script = OPEN_SOURCE.format(root=ROOT, variables=variables)
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_time, _, name = line[len("import time:") :].split("|")
+        if self_time.strip().isdigit():
+            times[name.strip()] = int(self_time)
+    return process.stdout.split(), times
+
+
+def check(entries=1000, workdir=None):
+    """
+    Returns: A JSON-serialisable dict of the modules a warm open imports,
+    their import time, and any that are forbidden.
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix="citation_vim_startup_")
+    os.makedirs(workdir, exist_ok=True)
+    bibtex_file = join(workdir, "library_%d.bib" % entries)
+    if not os.path.isfile(bibtex_file):
+        generate(bibtex_file, entries)
+    variables = {
+        "citation_vim_mode": "bibtex",
+        "citation_vim_bibtex_file": bibtex_file,
+        "citation_vim_cache_path": workdir,
+        "citation_vim_parser": "fast",
+    }
+    # The first open writes the cache, the second is the one checked
+    open_source(variables)
+    imported, times = open_source(variables)
+    forbidden = [
+        name
+        for name in imported
+        if any(name == f or name.startswith(f + ".") for f in FORBIDDEN)
+    ]
+    return {
+        "imported": imported,
+        "import_us": sum(times.get(name, 0) for name in imported),
+        "slowest": sorted(
+            ((times.get(name, 0), name) for name in imported), reverse=True
+        )[:10],
+        "forbidden": forbidden,
+    }
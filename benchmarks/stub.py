@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+import types
+from os.path import abspath, dirname, join
+
+ROOT = dirname(dirname(abspath(__file__)))
+
+
+class StubVim(object):
+    """
+    Answers the g:citation_vim_* lookup of ContextLoader without Neovim.
+    """
+
+    def __init__(self, variables):
+        self.variables = variables
+
+    def call(self, function, *args):
+        if function != "citation#context":
+            raise NotImplementedError(function)
+        return dict(self.variables)
+
+
+def gather(source, context):
+    """
+    Returns: All the candidates of an initialized source. While it is async
+    gather_candidates is called again with the "async" event, as Denite
+    polls it.
+    """
+    candidates = source.gather_candidates(context)
+    while context.get("is_async"):
+        time.sleep(0.001)
+        context["event"] = "async"
+        candidates += source.gather_candidates(context)
+    return candidates
+
+
+def load_source():
+    """
+    Returns: The Denite Source class, with a stand-in for denite's Base when
+    denite itself isn't installed.
+    """
+    try:
+        import denite
+    except ImportError:
+        denite = types.ModuleType("denite")
+        denite.__path__ = []
+        sys.modules["denite"] = denite
+    source_dir = join(ROOT, "rplugin", "python3", "denite")
+    if source_dir not in denite.__path__:
+        denite.__path__.append(source_dir)
+    try:
+        import denite.base.source
+    except ImportError:
+        base = types.ModuleType("denite.base")
+        base.__path__ = []
+        source = types.ModuleType("denite.base.source")
+
+        class Base(object):
+            def __init__(self, vim):
+                self.vim = vim
+
+            def print_message(self, context, expr):
+                pass
+
+        source.Base = Base
+        sys.modules["denite.base"] = base
+        sys.modules["denite.base.source"] = source
+    from denite.source.citation_collection import Source
+
+    return Source
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from os.path import join
+
+from benchmarks.generate import FIRST_NAMES, GROUPS, JOURNALS, LAST_NAMES, WORDS
+from benchmarks.stub import ROOT
+
+sys.path.insert(0, join(ROOT, "python"))
+
+from citation_vim import library as resident
+from citation_vim.context_loader import DEFAULTS
+from citation_vim.item import FIELDS
+
+# The tables of zotero.sqlite that the zotero parser reads.
+SCHEMA = """
+CREATE TABLE itemTypes (itemTypeID INTEGER PRIMARY KEY, typeName TEXT);
+CREATE TABLE fields (fieldID INTEGER PRIMARY KEY, fieldName TEXT);
+CREATE TABLE creatorTypes (creatorTypeID INTEGER PRIMARY KEY, creatorType TEXT);
+CREATE TABLE items (
+    itemID INTEGER PRIMARY KEY, itemTypeID INT, dateAdded TEXT,
+    dateModified TEXT, clientDateModified TEXT, libraryID INT, key TEXT
+);
+CREATE TABLE itemDataValues (valueID INTEGER PRIMARY KEY, value UNIQUE);
+CREATE TABLE itemData (
+    itemID INT, fieldID INT, valueID INT, PRIMARY KEY (itemID, fieldID)
+);
+CREATE TABLE creators (
+    creatorID INTEGER PRIMARY KEY, firstName TEXT, lastName TEXT, fieldMode INT
+);
+CREATE TABLE itemCreators (
+    itemID INT, creatorID INT, creatorTypeID INT, orderIndex INT,
+    PRIMARY KEY (itemID, orderIndex)
+);
+CREATE TABLE tags (tagID INTEGER PRIMARY KEY, name TEXT UNIQUE);
+CREATE TABLE itemTags (itemID INT, tagID INT, type INT, PRIMARY KEY (itemID, tagID));
+CREATE TABLE collections (
+    collectionID INTEGER PRIMARY KEY, collectionName TEXT, key TEXT
+);
+CREATE TABLE collectionItems (
+    collectionID INT, itemID INT, orderIndex INT,
+    PRIMARY KEY (collectionID, itemID)
+);
+CREATE TABLE itemAttachments (
+    itemID INTEGER PRIMARY KEY, parentItemID INT, linkMode INT,
+    contentType TEXT, path TEXT
+);
+CREATE TABLE itemNotes (
+    itemID INTEGER PRIMARY KEY, parentItemID INT, note TEXT, title TEXT
+);
+CREATE TABLE deletedItems (itemID INTEGER PRIMARY KEY, dateDeleted TEXT);
+CREATE INDEX itemAttachments_parentItemID ON itemAttachments(parentItemID);
+CREATE INDEX itemNotes_parentItemID ON itemNotes(parentItemID);
+CREATE INDEX collectionItems_itemID ON collectionItems(itemID);
+"""
+
+ITEM_TYPES = ["journalArticle"] * 6 + ["book", "conferencePaper", "thesis"]
+FIELD_NAMES = [
+    "title",
+    "date",
+    "publicationTitle",
+    "volume",
+    "issue",
+    "pages",
+    "DOI",
+    "abstractNote",
+    "url",
+    "language",
+    "extra",
+]
+KEY_CHARS = "23456789ABCDEFGHIJKLMNPQRSTUVWXYZ"
+# Keys generated for items without a Citation Key in extra
+KEY_FORMAT = "{author}{date}{title}"
+
+
+def generate_database(path, entries, seed=0):
+    """
+    Writes a deterministic synthetic Zotero database with `entries`
+    references to path, with notes, PDF attachments, tags and collections.
+    """
+    rand = random.Random(seed)
+    if os.path.exists(path):
+        os.unlink(path)
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+    types = sorted(set(ITEM_TYPES)) + ["attachment", "note"]
+    connection.executemany(
+        "INSERT INTO itemTypes VALUES (?, ?)", list(enumerate(types, 1))
+    )
+    type_ids = dict((name, number) for number, name in enumerate(types, 1))
+    connection.executemany(
+        "INSERT INTO fields VALUES (?, ?)", list(enumerate(FIELD_NAMES, 1))
+    )
+    field_ids = dict((name, number) for number, name in enumerate(FIELD_NAMES, 1))
+    connection.executemany(
+        "INSERT INTO creatorTypes VALUES (?, ?)", [(1, "author"), (2, "editor")]
+    )
+    connection.executemany(
+        "INSERT INTO tags (tagID, name) VALUES (?, ?)", list(enumerate(WORDS, 1))
+    )
+    connection.executemany(
+        "INSERT INTO collections (collectionID, collectionName) VALUES (?, ?)",
+        list(enumerate(GROUPS, 1)),
+    )
+
+    values = {}
+    item_id = 0
+    for number in range(entries):
+        item_id += 1
+        parent = item_id
+        year = rand.randint(1950, 2026)
+        stamp = "%d-%02d-%02d %02d:%02d:%02d" % (
+            rand.randint(2015, 2026),
+            rand.randint(1, 12),
+            rand.randint(1, 28),
+            rand.randint(0, 23),
+            rand.randint(0, 59),
+            rand.randint(0, 59),
+        )
+        _insert_item(connection, parent, type_ids[rand.choice(ITEM_TYPES)], stamp)
+        title_words = rand.sample(WORDS, rand.randint(3, 10))
+        data = {
+            "title": " ".join(title_words).capitalize(),
+            "date": "%d-%02d-00 %d" % (year, rand.randint(1, 12), year),
+            "publicationTitle": rand.choice(JOURNALS)[1],
+            "volume": str(rand.randint(1, 400)),
+            "issue": str(rand.randint(1, 12)),
+            "pages": "%d-%d" % (rand.randint(1, 500), rand.randint(501, 999)),
+            "DOI": "10.%d/%s.%d" % (rand.randint(1000, 9999), title_words[0], number),
+            "abstractNote": " ".join(
+                rand.choice(WORDS) for _ in range(rand.randint(40, 250))
+            ),
+        }
+        if rand.random() < 0.5:
+            data["language"] = "en"
+        if rand.random() < 0.3:
+            data["url"] = "https://example.org/%d" % number
+        if rand.random() < 0.5:
+            data["extra"] = "Citation Key: %s%d%s%d" % (
+                rand.choice(LAST_NAMES).lower().replace("'", ""),
+                year,
+                title_words[0],
+                number,
+            )
+        for name, value in data.items():
+            if value not in values:
+                values[value] = len(values) + 1
+                connection.execute(
+                    "INSERT INTO itemDataValues VALUES (?, ?)", (values[value], value)
+                )
+            connection.execute(
+                "INSERT INTO itemData VALUES (?, ?, ?)",
+                (parent, field_ids[name], values[value]),
+            )
+        for order in range(rand.choice([1, 1, 2, 3, 4, 6, 12])):
+            connection.execute(
+                "INSERT INTO creators (firstName, lastName, fieldMode) "
+                "VALUES (?, ?, 0)",
+                (rand.choice(FIRST_NAMES), rand.choice(LAST_NAMES)),
+            )
+            connection.execute(
+                "INSERT INTO itemCreators VALUES (?, last_insert_rowid(), 1, ?)",
+                (parent, order),
+            )
+        for tag in rand.sample(range(1, len(WORDS) + 1), rand.randint(0, 5)):
+            connection.execute("INSERT INTO itemTags VALUES (?, ?, 0)", (parent, tag))
+        if rand.random() < 0.4:
+            for group in rand.sample(range(1, len(GROUPS) + 1), rand.randint(1, 2)):
+                connection.execute(
+                    "INSERT INTO collectionItems VALUES (?, ?, 0)", (group, parent)
+                )
+        if rand.random() < 0.8:
+            item_id += 1
+            _insert_item(connection, item_id, type_ids["attachment"], stamp)
+            connection.execute(
+                "INSERT INTO itemAttachments VALUES (?, ?, 0, ?, ?)",
+                (item_id, parent, "application/pdf", "storage:%s.pdf" % title_words[0]),
+            )
+        if rand.random() < 0.1:
+            item_id += 1
+            _insert_item(connection, item_id, type_ids["note"], stamp)
+            connection.execute(
+                "INSERT INTO itemNotes VALUES (?, ?, ?, '')",
+                (item_id, parent, "<p>%s &amp; %s</p>" % tuple(title_words[:2])),
+            )
+    connection.commit()
+    connection.close()
+
+
+def _insert_item(connection, item_id, type_id, stamp):
+    key = "".join(KEY_CHARS[(item_id * 7 + i * 13) % len(KEY_CHARS)] for i in range(8))
+    connection.execute(
+        "INSERT INTO items VALUES (?, ?, ?, ?, ?, 1, ?)",
+        (item_id, type_id, stamp, stamp, stamp, key + str(item_id)),
+    )
+
+
+def modify_items(path, count, seed=0):
+    """
+    Retitles `count` random references, as Zotero would when they are
+    edited, and returns their Zotero keys.
+    """
+    rand = random.Random(seed)
+    connection = sqlite3.connect(path)
+    rows = connection.execute(
+        "SELECT itemID, key FROM items WHERE itemID IN (SELECT itemID FROM itemData)"
+    ).fetchall()
+    modified = rand.sample(rows, min(count, len(rows)))
+    for item_id, _ in modified:
+        connection.execute(
+            "INSERT OR IGNORE INTO itemDataValues (value) VALUES (?)",
+            ("Edited %d" % item_id,),
+        )
+        connection.execute(
+            "UPDATE itemData SET valueID = "
+            "(SELECT valueID FROM itemDataValues WHERE value = ?) "
+            "WHERE itemID = ? AND fieldID = 1",
+            ("Edited %d" % item_id, item_id),
+        )
+        connection.execute(
+            "UPDATE items SET clientDateModified = datetime('now'), "
+            "dateModified = datetime('now') WHERE itemID = ?",
+            (item_id,),
+        )
+    connection.commit()
+    connection.close()
+    return [key for _, key in modified]
+
+
+def check(entries=10000, changed=100, workdir=None, key_format=KEY_FORMAT):
+    """
+    Returns: A JSON-serialisable dict of the time to read a synthetic Zotero
+    database, to open it from the cache, and to refresh it after `changed`
+    items were edited, with any fields where the refresh differs from a
+    full read.
+
+    Keys generated before the refresh are kept by it, so they are counted
+    separately from the other differences, along with keys that aren't
+    unique.
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix="citation_vim_zotero_")
+    os.makedirs(workdir, exist_ok=True)
+    database = join(workdir, "zotero.sqlite")
+    generate_database(database, entries)
+    context = dict(DEFAULTS)
+    context.update(
+        {
+            "mode": "zotero",
+            "bibtex_file": database,
+            "cache_path": workdir,
+            "zotero_attachment_path": "",
+            "parser": "fast",
+            "key_format": key_format,
+        }
+    )
+    results = {}
+    start = time.perf_counter()
+    resident.update_cache(context, force=True)
+    results["full_read"] = time.perf_counter() - start
+    start = time.perf_counter()
+    resident.update_cache(context)
+    results["cached_open"] = time.perf_counter() - start
+
+    keys = set(modify_items(database, changed))
+    start = time.perf_counter()
+    refreshed = resident.update_cache(context)
+    results["refresh"] = time.perf_counter() - start
+    expected = resident.update_cache(context, force=True)
+
+    differences = []
+    kept_keys = 0
+    for before, after in zip(expected["items"], refreshed["items"]):
+        for field in FIELDS:
+            if getattr(before, field) == getattr(after, field):
+                continue
+            if field == "key":
+                kept_keys += 1
+            else:
+                differences.append((after.zotero_key, field))
+    retitled = sum(item.title.startswith("Edited") for item in refreshed["items"])
+    item_keys = [item.key for item in refreshed["items"]]
+    results["differences"] = differences
+    results["kept_keys"] = kept_keys
+    results["shared_keys"] = len(item_keys) - len(set(item_keys))
+    results["length_matches"] = len(expected["items"]) == len(refreshed["items"])
+    results["retitled"] = "%d of %d" % (retitled, len(keys))
+    return results
@@ -7,5 +7,31 @@ if !exists('g:citation_vim_bibtex_file')
 endif
 
 if !exists('g:citation_vim_review_directory')
-  let g:citation_vim_cache_path = ""
+  let g:citation_vim_review_directory = ""
+endif
+
+if !exists('g:citation_vim_warmup_filetypes')
+  let g:citation_vim_warmup_filetypes = ['tex', 'plaintex', 'markdown', 'pandoc', 'rmd']
 endif
+
+" With g:citation_vim_warmup set, the library is loaded in the background
+" when a document is opened, and refreshed when its bibtex file is written
+function! s:warmup(filetype) abort
+  if get(g:, 'citation_vim_warmup', 0)
+        \ && index(g:citation_vim_warmup_filetypes, a:filetype) >= 0
+    call citation#warmup()
+  endif
+endfunction
+
+augroup citation_warmup
+  autocmd!
+  autocmd VimEnter * call s:warmup(&filetype)
+  autocmd FileType * if v:vim_did_enter | call s:warmup(expand('<amatch>')) | endif
+  autocmd BufWritePost *.bib if get(g:, 'citation_vim_warmup', 0)
+        \ | call citation#refresh_file(expand('<afile>:p')) | endif
+augroup END
+
+command! CitationReload call citation#reload()
+command! CitationStats call citation#stats()
+command! CitationCheckBuffer call citation#check_buffer()
+command! -nargs=1 -complete=file CitationExportBib call citation#export_bib(<q-args>)
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import os
+import sys
+
+from citation_vim import cli, stats
+from citation_vim.sorting import MODES as SORT_MODES
+
+
+def main(argv=None):
+    # Options of every command, named after the g:citation_vim_* settings
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        "--bibtex-file",
+        action="append",
+        default=[],
+        help="bibtex file or glob, can be repeated",
+    )
+    common.add_argument("--mode", choices=["bibtex", "zotero"], default="bibtex")
+    common.add_argument("--zotero-path", help="directory of zotero.sqlite")
+    common.add_argument(
+        "--cache-path",
+        help="the plugin's g:citation_vim_cache_path, by default "
+        "$XDG_CACHE_HOME/citation_vim",
+    )
+    common.add_argument("--parser", choices=["fast", "pybtex"])
+    common.add_argument("--et-al-limit", type=int)
+    common.add_argument("--key-format")
+    common.add_argument("--sort", choices=SORT_MODES, default="file")
+    common.add_argument("--format", choices=["jsonl", "tsv"], default="jsonl")
+    common.add_argument("--header", action="store_true", help="TSV column names")
+    common.add_argument(
+        "--timings", action="store_true", help="print phase timings to stderr"
+    )
+
+    parser = argparse.ArgumentParser(
+        prog="python -m citation_vim",
+        description="Query the library of citation.vim without Vim, sharing "
+        "its cache.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser(
+        "query",
+        parents=[common],
+        help="entries matching every word, all of them without words",
+    )
+    command.add_argument("words", nargs="*")
+    command.add_argument("--fields", default=",".join(cli.DEFAULT_FIELDS))
+    command.add_argument("--limit", type=int, default=0)
+
+    command = commands.add_parser(
+        "keys",
+        parents=[common],
+        help="look up citation keys, exits with 1 if any is missing",
+    )
+    command.add_argument("keys", nargs="*", help="keys, or - to read them from stdin")
+    command.add_argument(
+        "--cited", nargs="+", default=[], help="LaTeX or Markdown files citing keys"
+    )
+    command.add_argument("--fields", default=",".join(cli.DEFAULT_FIELDS))
+
+    commands.add_parser("dupes", parents=[common], help="groups of duplicate entries")
+    commands.add_parser(
+        "stats", parents=[common], help="entries, labels and cache size of each file"
+    )
+
+    args = parser.parse_args(argv)
+    stats.configure(args.timings)
+    try:
+        library = cli.get_cli_library(_variables(args))
+        missing = 0
+        if args.command == "query":
+            fields = cli.check_fields(args.fields.split(","))
+            rows = cli.query_rows(library, args.words, fields, args.sort, args.limit)
+        elif args.command == "keys":
+            fields = cli.check_fields(args.fields.split(","))
+            keys = [key for key in args.keys if key != "-"]
+            if "-" in args.keys:
+                keys.extend(line.strip() for line in sys.stdin if line.strip())
+            keys.extend(cli.cited_keys(args.cited))
+            rows = list(cli.key_rows(library, keys, fields))
+            missing = sum(row["status"] == "missing" for row in rows)
+        elif args.command == "dupes":
+            rows = cli.duplicate_rows(library)
+        else:
+            rows = cli.stats_rows(library)
+        cli.write_rows(sys.stdout, rows, args.format, args.header)
+    except RuntimeError as error:
+        print(error, file=sys.stderr)
+        return 2
+    except BrokenPipeError:
+        # The reader, e.g. head or fzf, stopped early. Output that is left
+        # goes nowhere, rather than failing again on exit.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    if args.timings:
+        print(stats.report(), file=sys.stderr)
+    return 1 if missing else 0
+
+
+def _variables(args):
+    """
+    Returns: The g:citation_vim_* variables the options stand for.
+    """
+    variables = {
+        "citation_vim_mode": args.mode,
+        "citation_vim_bibtex_file": args.bibtex_file,
+        "citation_vim_cache_path": args.cache_path or _default_cache_path(),
+        "citation_vim_sort": args.sort,
+    }
+    options = {
+        "citation_vim_zotero_path": args.zotero_path,
+        "citation_vim_parser": args.parser,
+        "citation_vim_et_al_limit": args.et_al_limit,
+        "citation_vim_key_format": args.key_format,
+    }
+    for name, value in options.items():
+        if value is not None:
+            variables[name] = value
+    return variables
+
+
+def _default_cache_path():
+    """
+    Returns: The cache directory of the user, created if it is missing, so
+    caches and locks aren't written to the working directory.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    path = os.path.join(cache_home, "citation_vim")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,43 @@
 # -*- coding: utf-8 -*-
 import sys
 import re
-from pybtex.database.input import bibtex
+from citation_vim import stats
 from citation_vim.item import Item
-from citation_vim.utils import check_path, raiseError
+from citation_vim.labels import split_labels
+from citation_vim.bibtex.scanner import MACRO_TYPES, IGNORED_TYPES
+from citation_vim.bibtex.scanner import find_repeats, scan_data, scan_file
+from citation_vim.bibtex.scanner import scan_spans
+from citation_vim.utils import check_path, format_author, raiseError
+
+
+# Bibtex fields read by build_items, the fast parser skips all others.
+FIELDS = frozenset(
+    [
+        "abstract",
+        "annotation",
+        "annote",
+        "date",
+        "doi",
+        "file",
+        "groups",
+        "institution",
+        "isbn",
+        "journal",
+        "key",
+        "keyword",
+        "keywords",
+        "langid",
+        "language",
+        "number",
+        "pages",
+        "publisher",
+        "school",
+        "title",
+        "url",
+        "volume",
+        "year",
+    ]
+)
 
 
 class BibtexParser(object):
@@ -17,15 +51,107 @@ class BibtexParser(object):
         """
         Returns: A bibtex file as an array of standardised Items.
         """
-        bib_data = self._read_file(self.context["bibtex_file"])
-        return self.build_items(bib_data)
+        with stats.timer("parse"):
+            bib_data = self._read_file(self.context["bibtex_file"])
+        with stats.timer("build_items"):
+            items = self.build_items(bib_data)
+        stats.count("entries_parsed", len(items))
+        return items
+
+    def update(self, library=None):
+        """
+        Returns: A library dict for the bibtex file. Entries whose text is
+        unchanged since `library` was built are reused, only added and
+        modified entries are parsed. Falls back to a full parse when the
+        file can't be diffed entry by entry.
+
+        Entries repeating the key of an earlier entry are kept, parsed one
+        at a time, so they are listed with the duplicates.
+        """
+        with open(self.context["bibtex_file"], "rb") as in_file:
+            data = in_file.read()
+        stats.count("bytes_read", len(data))
+        try:
+            with stats.timer("scan_spans"):
+                spans = scan_spans(data)
+        except ValueError:
+            return self._build_library(self.load(), None, None)
+        macros = [span for span in spans if span.type in MACRO_TYPES]
+        entries = [
+            span for span in spans if span.type not in MACRO_TYPES + IGNORED_TYPES
+        ]
+        repeats = find_repeats(entries)
+        macro_digests = [span.digest for span in macros]
+        if (
+            library is None
+            or library["spans"] is None
+            or library["macros"] != macro_digests
+        ):
+            if not repeats:
+                items = self.load()
+                return self._build_library(items, _align(items, entries), macros)
+            library = None
+
+        reusable = {}
+        if library is not None:
+            for span, item in zip(library["spans"], library["items"]):
+                reusable[(span.key, span.digest)] = item
+        changed = [span for span in entries if (span.key, span.digest) not in reusable]
+        parsed = {}
+        if changed:
+            macro_blocks = [data[span.start : span.end] for span in macros]
+            blocks = [
+                data[span.start : span.end] for span in changed if span not in repeats
+            ]
+            with stats.timer("parse"):
+                bib_data = self._read_string(b"\n".join(macro_blocks + blocks))
+            with stats.timer("build_items"):
+                for item in self.build_items(bib_data):
+                    parsed[item.key] = item
+                for span in changed:
+                    if span in repeats:
+                        # A file can only define a key once, so it's parsed alone
+                        block = data[span.start : span.end]
+                        text = b"\n".join(macro_blocks + [block])
+                        for item in self.build_items(self._read_string(text)):
+                            parsed[span] = item
+            stats.count("entries_parsed", len(parsed))
+        stats.count("entries_reused", len(entries) - len(changed))
+        if repeats:
+            stats.count("entries_repeated", len(repeats))
+
+        items = []
+        kept = []
+        for span in entries:
+            item = reusable.get((span.key, span.digest))
+            if item is None:
+                item = parsed.get(span if span in repeats else span.key)
+            if item is not None:
+                items.append(item)
+                kept.append(span)
+        return self._build_library(items, kept, macros)
+
+    def _build_library(self, items, spans, macros):
+        """
+        Returns: A library dict of items in file order, with the spans they
+        were parsed from, or None, and the digests and offsets of the macro
+        spans.
+        """
+        return {
+            "items": items,
+            "spans": spans,
+            "macros": None if macros is None else [span.digest for span in macros],
+            "macro_spans": (
+                None if macros is None else [(s.start, s.end) for s in macros]
+            ),
+        }
 
     def build_items(self, bib_data):
         items = []
         for key in bib_data.entries:
             item = Item()
-            item.collections = []
             bib_entry = bib_data.entries[key]
+            item.collections = split_labels(self.get_field(bib_entry, "groups"))
             authors = self.parse_authors(bib_entry)
             item.author = self.format_author(authors)
             item.type = bib_entry.type
@@ -48,17 +174,31 @@ class BibtexParser(object):
             item.file = self.format_file(bib_entry)
             item.nick = self.get_field(bib_entry, "key")
             item.key = key
-            item.combine()
             items.append(item)
         return items
 
     def _read_file(self, filename):
         """
-        Returns: A bibtex file from the pybtex parser
+        Returns: A bibtex file from the pybtex parser, or the fast scanner
         """
+        if self.context.get("parser") == "fast":
+            return scan_file(filename, FIELDS)
+        from pybtex.database.input import bibtex
+
         parser = bibtex.Parser()
         return parser.parse_file(filename)
 
+    def _read_string(self, data):
+        """
+        Returns: Bibtex data for a subset of the file
+        """
+        if self.context.get("parser") == "fast":
+            return scan_data(data, FIELDS)
+        from pybtex.database.input import bibtex
+
+        parser = bibtex.Parser()
+        return parser.parse_string(data.decode("utf-8"))
+
     def strip_braces(self, string):
         """
         Returns: string stripped of {} braces.
@@ -98,18 +238,7 @@ class BibtexParser(object):
         """
         Returns: Authors - format depending on et_al_limit.
         """
-        if authors == []:
-            return ""
-        if len(authors) > self.context["et_al_limit"]:
-            return "%s et al." % authors[0][0]
-        if len(authors) > 2:
-            auth_string = ""
-            for author in authors[:-1]:
-                auth_string += author[0] + ", "
-            return auth_string + "& " + authors[-1][0]
-        if len(authors) == 2:
-            return authors[0][0] + " & " + authors[1][0]
-        return ", ".join(authors[0])
+        return format_author(authors, self.context["et_al_limit"])
 
     def format_file(self, bib_entry):
         """
@@ -159,3 +288,12 @@ class BibtexParser(object):
                     output = split
                     break
         return output
+
+
+def _align(items, spans):
+    """
+    Returns: The span of each item, None unless every item has one.
+    """
+    by_key = dict((span.key, span) for span in spans)
+    aligned = [by_key.get(item.key) for item in items]
+    return None if None in aligned else aligned
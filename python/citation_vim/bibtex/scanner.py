@@ -0,0 +1,430 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import functools
+import hashlib
+import mmap
+import os
+import re
+
+# Block types that are not bibliography entries.
+MACRO_TYPES = ("string", "preamble")
+IGNORED_TYPES = ("comment",)
+
+BLOCK_START = re.compile(rb"@[ \t\r\n]*([A-Za-z][A-Za-z0-9_-]*)[ \t\r\n]*([{(])")
+DELIMITERS = re.compile(rb"[{}()]")
+
+Span = collections.namedtuple("Span", ["type", "key", "start", "end", "digest"])
+
+
+def digest(data):
+    """
+    Returns: A short content hash for a block of the bibtex file.
+    """
+    return hashlib.blake2b(data, digest_size=8).digest()
+
+
+def scan_spans(data):
+    """
+    Returns: An array of Spans, one per top-level @block of the bibtex data,
+    in file order.
+
+    Raises ValueError if the block structure can't be determined, e.g. on
+    unbalanced braces.
+    """
+    spans = []
+    pos = 0
+    length = len(data)
+    while pos < length:
+        match = BLOCK_START.search(data, pos)
+        if match is None:
+            break
+        block_type = match.group(1).decode("ascii").lower()
+        end = _find_block_end(data, match.end(), match.group(2))
+        key = ""
+        if block_type not in MACRO_TYPES + IGNORED_TYPES:
+            comma = data.find(b",", match.end(), end)
+            if comma < 0:
+                comma = end - 1
+            key = data[match.end() : comma].strip().decode("utf-8", "replace")
+        start = match.start()
+        spans.append(Span(block_type, key, start, end, digest(data[start:end])))
+        pos = end
+    return spans
+
+
+def find_repeats(spans):
+    """
+    Returns: The set of entry spans whose key an earlier entry of the file
+    already defined, compared ignoring case as BibTeX does. Parsers keep
+    only the first of them, or fail.
+    """
+    seen = set()
+    repeats = set()
+    for span in spans:
+        if span.type in MACRO_TYPES + IGNORED_TYPES:
+            continue
+        key = span.key.lower()
+        if key in seen:
+            repeats.add(span)
+        seen.add(key)
+    return repeats
+
+
+def _find_block_end(data, pos, opener):
+    """
+    Returns: The offset just past the delimiter closing the block opened
+    before `pos`.
+    """
+    depth = 0
+    for match in DELIMITERS.finditer(data, pos):
+        char = match.group()
+        if char == b"{":
+            depth += 1
+        elif char == b"}":
+            if depth == 0:
+                if opener == b"{":
+                    return match.end()
+                raise ValueError("Unbalanced braces at offset %d" % match.start())
+            depth -= 1
+        elif char == b")" and opener == b"(" and depth == 0:
+            return match.end()
+    raise ValueError("Unterminated block at offset %d" % pos)
+
+
+MONTH_NAMES = {
+    "jan": "January",
+    "feb": "February",
+    "mar": "March",
+    "apr": "April",
+    "may": "May",
+    "jun": "June",
+    "jul": "July",
+    "aug": "August",
+    "sep": "September",
+    "oct": "October",
+    "nov": "November",
+    "dec": "December",
+}
+
+NAME_CHARS = rb"A-Za-z@!$&*+\-./:;<>?\[\\\]^_`|~\x7f"
+NAME = rb"[" + NAME_CHARS + rb"][0-9" + NAME_CHARS + rb"]*"
+FIELD_START = re.compile(rb"\s*(" + NAME + rb")\s*=\s*")
+# A field whose value has no nested braces and no # concatenation.
+SIMPLE_FIELD = re.compile(
+    rb"\s*("
+    + NAME
+    + rb')\s*=\s*(?:\{([^{}]*)\}|"([^"{}]*)"|([0-9]+)|('
+    + NAME
+    + rb"))(?=\s*[,})])"
+)
+VALUE_NAME = re.compile(NAME)
+NUMBER = re.compile(rb"[0-9]+")
+KEY_BRACE = re.compile(rb"\s*([^\s,}]+)")
+KEY_PAREN = re.compile(rb"\s*([^\s,]+)")
+SEPARATOR = re.compile(rb"\s*([#,})])")
+SPACE = re.compile(rb"\s*")
+QUOTED = re.compile(rb'[{}"]')
+BRACED = re.compile(rb"[{}]")
+WHITESPACE = re.compile(r"\s+")
+AND = re.compile(r"\s+[Aa][Nn][Dd]\s+")
+NAME_SPACE = re.compile(r"(?:\\ |\s|(?<!\\)~)+")
+COMMA = re.compile(r"\s*,\s*")
+
+
+class ScannedEntry(object):
+    """
+    The parts of a bibtex entry that BibtexParser.build_items reads, in the
+    shape of a pybtex Entry.
+    """
+
+    __slots__ = ("type", "fields", "persons")
+
+    def __init__(self, entry_type):
+        self.type = entry_type
+        self.fields = {}
+        self.persons = {}
+
+
+class ScannedData(object):
+    """
+    Entries of a scanned bibtex file, in the shape of pybtex BibliographyData.
+    """
+
+    def __init__(self):
+        self.entries = collections.OrderedDict()
+
+
+def scan_file(filename, fields=None):
+    """
+    Returns: ScannedData for a bibtex file, read through a memory map.
+    """
+    with open(filename, "rb") as in_file:
+        if os.fstat(in_file.fileno()).st_size == 0:
+            return ScannedData()
+        with mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return scan_data(data, fields)
+
+
+def scan_data(data, fields=None):
+    """
+    Returns: ScannedData for bibtex bytes, keeping only `fields` (all fields
+    if None) and the authors. @string macros are expanded, blocks that fail
+    to tokenize are skipped.
+    """
+    result = ScannedData()
+    macros = dict(MONTH_NAMES)
+    seen = set()
+    pos = 0
+    length = len(data)
+    while pos < length:
+        match = BLOCK_START.search(data, pos)
+        if match is None:
+            break
+        block_type = match.group(1).decode("ascii").lower()
+        closer = b"}" if match.group(2) == b"{" else b")"
+        try:
+            if block_type == "comment":
+                pos = _find_block_end(data, match.end(), match.group(2))
+            elif block_type == "string":
+                pos = _scan_string(data, match.end(), closer, macros)
+            elif block_type == "preamble":
+                pos = _scan_value(data, match.end(), macros, False)[1]
+                pos = _expect_end(data, pos, closer)
+            else:
+                entry, key, pos = _scan_entry(
+                    data, match.end(), block_type, closer, macros, fields
+                )
+                if key.lower() not in seen:
+                    seen.add(key.lower())
+                    result.entries[key] = entry
+        except ValueError:
+            pos = match.end()
+    return result
+
+
+def _scan_string(data, pos, closer, macros):
+    match = FIELD_START.match(data, pos)
+    if match is None:
+        raise ValueError("Invalid @string at offset %d" % pos)
+    value, pos = _scan_value(data, match.end(), macros, True)
+    macros[match.group(1).decode("utf-8").lower()] = value
+    return _expect_end(data, pos, closer)
+
+
+def _scan_entry(data, pos, entry_type, closer, macros, fields):
+    key_pattern = KEY_BRACE if closer == b"}" else KEY_PAREN
+    match = key_pattern.match(data, pos)
+    if match is None:
+        raise ValueError("Missing entry key at offset %d" % pos)
+    key = match.group(1).decode("utf-8")
+    entry = ScannedEntry(entry_type)
+    pos = match.end()
+    while True:
+        separator = SEPARATOR.match(data, pos)
+        if separator is None:
+            raise ValueError("Unexpected text at offset %d" % pos)
+        pos = separator.end()
+        if separator.group(1) == closer:
+            return entry, key, pos
+        if separator.group(1) != b",":
+            raise ValueError("Unexpected text at offset %d" % pos)
+        match = SIMPLE_FIELD.match(data, pos) or FIELD_START.match(data, pos)
+        if match is None:
+            continue
+        name = match.group(1).decode("utf-8").lower()
+        wanted = name == "author" or fields is None or name in fields
+        if match.re is FIELD_START:
+            value, pos = _scan_value(data, match.end(), macros, wanted)
+        else:
+            pos = match.end()
+            if not wanted:
+                continue
+            value = match.group(match.lastindex).decode("utf-8")
+            if match.lastindex == 5:
+                value = macros.get(value.lower(), "")
+        if not wanted or name in entry.fields or name in entry.persons:
+            continue
+        value = value.strip()
+        # Whitespace other than single spaces is never printable
+        if "  " in value or not value.isprintable():
+            value = WHITESPACE.sub(" ", value)
+        if name == "author":
+            entry.persons[name] = [
+                format_person(person) for person in split_names(value)
+            ]
+        else:
+            entry.fields[name] = value
+
+
+def _scan_value(data, pos, macros, wanted):
+    """
+    Returns: The concatenated value starting at `pos` and the offset after
+    it. Parts are only decoded when the value is `wanted`.
+    """
+    parts = []
+    while True:
+        pos = SPACE.match(data, pos).end()
+        char = data[pos : pos + 1]
+        if char == b"{":
+            end = _find_string_end(data, pos + 1, BRACED, b"}")
+            part = data[pos + 1 : end - 1]
+        elif char == b'"':
+            end = _find_string_end(data, pos + 1, QUOTED, b'"')
+            part = data[pos + 1 : end - 1]
+        else:
+            match = NUMBER.match(data, pos) or VALUE_NAME.match(data, pos)
+            if match is None:
+                raise ValueError("Missing field value at offset %d" % pos)
+            end = match.end()
+            part = match.group()
+            if wanted and not part.isdigit():
+                part = macros.get(part.decode("utf-8").lower(), "")
+        if wanted:
+            parts.append(part if isinstance(part, str) else part.decode("utf-8"))
+        separator = SEPARATOR.match(data, end)
+        if separator is None or separator.group(1) != b"#":
+            return "".join(parts), end
+        pos = separator.end()
+
+
+def _find_string_end(data, pos, pattern, closer):
+    """
+    Returns: The offset just past the `closer` ending a field value at brace
+    level 0.
+    """
+    depth = 0
+    for match in pattern.finditer(data, pos):
+        char = match.group()
+        if char == b"{":
+            depth += 1
+        elif depth == 0 and char == closer:
+            return match.end()
+        elif char == b"}":
+            if depth == 0:
+                raise ValueError("Unbalanced braces at offset %d" % match.start())
+            depth -= 1
+    raise ValueError("Unterminated value at offset %d" % pos)
+
+
+def _expect_end(data, pos, closer):
+    separator = SEPARATOR.match(data, pos)
+    if separator is None or separator.group(1) != closer:
+        raise ValueError("Unterminated block at offset %d" % pos)
+    return separator.end()
+
+
+def split_tex(string, separator):
+    """
+    Returns: string split on the separator regex, ignoring separators inside
+    braces.
+    """
+    parts = []
+    start = 0
+    depth = 0
+    protected = []
+    for index, char in enumerate(string):
+        if char == "{":
+            if depth == 0:
+                protected.append(index)
+            depth += 1
+        elif char == "}" and depth > 0:
+            depth -= 1
+            if depth == 0:
+                protected.append(index)
+    if not protected:
+        return [part.strip() for part in separator.split(string)]
+    bounds = list(zip(protected[::2], protected[1::2] + [len(string)]))
+    for match in separator.finditer(string):
+        if any(low < match.start() < high for low, high in bounds):
+            continue
+        parts.append(string[start : match.start()].strip())
+        start = match.end()
+    parts.append(string[start:].strip())
+    return parts
+
+
+def split_names(string):
+    """
+    Returns: The names of a bibtex name list, separated by "and".
+    """
+    return [name for name in split_tex(string, AND) if name]
+
+
+@functools.lru_cache(maxsize=65536)
+def format_person(name):
+    """
+    Returns: The name formatted as "von Last, Jr, First", as pybtex does.
+    """
+    parts = split_tex(name, COMMA)
+    first = []
+    lineage = []
+    if len(parts) > 3:
+        parts = parts[:2] + [" ".join(parts[2:])]
+    if len(parts) == 3:
+        von_last = _words(parts[0])
+        lineage = _words(parts[1])
+        first = _words(parts[2])
+    elif len(parts) == 2:
+        von_last = _words(parts[0])
+        first = _words(parts[1])
+    else:
+        words = _words(name)
+        split = len(words)
+        for index, word in enumerate(words):
+            if _is_von(word):
+                split = index
+                break
+        first, von_last = words[:split], words[split:]
+        if not von_last and first:
+            von_last = [first.pop()]
+    return ", ".join(
+        part
+        for part in (" ".join(von_last), " ".join(lineage), " ".join(first))
+        if part
+    )
+
+
+def _words(string):
+    return [word for word in split_tex(string, NAME_SPACE) if word]
+
+
+def _is_von(word):
+    if word[0].isupper():
+        return False
+    if word[0].islower():
+        return True
+    depth = 0
+    for position, char in enumerate(word):
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+        elif depth == 0 and char.isalpha():
+            return char.islower()
+        elif depth == 1 and char == "\\":
+            return _is_lower_special(word[position + 1 :])
+    return False
+
+
+def _is_lower_special(special):
+    """
+    Returns: Whether a special character such as {\\'e} or {\\v{s}} is
+    lowercase, from the first letter after its control sequence. special
+    starts after the backslash and runs to the end of the word.
+    """
+    control_sequence = True
+    depth = 1
+    for char in special:
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                break
+        if control_sequence:
+            if not char.isalpha():
+                control_sequence = False
+        elif char.isalpha():
+            return char.islower()
+    return False
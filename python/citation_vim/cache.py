@@ -0,0 +1,665 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from array import array
+from citation_vim import stats
+from citation_vim.duplicates import fingerprint as duplicate_fingerprint
+from citation_vim.item import Item, FIELDS
+from citation_vim.labels import KINDS as LABEL_KINDS
+from citation_vim.labels import LabelTable, build_labels
+from citation_vim.search import TokenIndex, build_index
+from citation_vim.sorting import NUMERIC as NUMERIC_SORT_MODES
+from citation_vim.sorting import SortKeys, build_sort_keys
+from citation_vim.utils import raiseError
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Bump when the layout of the cache file changes.
+CACHE_VERSION = 4
+MAGIC = b"CITEVIM\x00"
+
+# magic, version, reserved, settings fingerprint, entries, fields, sections
+HEADER = struct.Struct("<8sHH16sIII")
+# name, offset, length
+SECTION = struct.Struct("<16sQQ")
+# start, end, digest
+SPAN = struct.Struct("<QQ8s")
+# start, end of an @string or @preamble block
+MACRO_SPAN = struct.Struct("<QQ")
+# size, mtime_ns and content digest of the bibtex file the cache was built from
+SOURCE = struct.Struct("<QQ16s")
+
+LIST_SEPARATOR = "\x1f"
+
+# Fields with few distinct values, stored once in the cache and interned.
+POOLED_FIELDS = frozenset(["type", "author", "publication", "publisher", "language"])
+# Free text that CachedItems read from the cache on every access, rather than
+# keeping it in memory.
+LARGE_FIELDS = frozenset(["abstract", "notes", "url", "file"])
+
+# Section name prefix of each label index
+LABEL_SECTIONS = {"tags": b"tag", "collections": b"coll"}
+
+# Sort modes whose order is cached, besides file order
+SORT_SECTIONS = {
+    "date": (b"sort_years", b"order_date"),
+    "modified": (b"sort_modified", b"order_modified"),
+    "author": (b"sort_authors", b"order_author"),
+    "title": (b"sort_titles", b"order_title"),
+}
+
+
+def fingerprint(context):
+    """
+    Returns: A digest of the settings that change the content of the cache.
+    Entries are cached in file order, with the order of each sort mode, so
+    sort and reverse_order are applied on load and don't invalidate it.
+    Keys are only generated in zotero mode.
+    """
+    settings = (
+        os.path.abspath(context["bibtex_file"]),
+        context["et_al_limit"],
+        context["parser"],
+        FIELDS,
+    )
+    if context.get("mode") == "zotero":
+        settings += tuple(
+            getattr(context.get(name), "pattern", context.get(name))
+            for name in ("key_format", "key_clean_regex", "key_title_banned_regex")
+        )
+    return hashlib.md5(repr(settings).encode("utf-8")).digest()
+
+
+def get_cache_file(context):
+    """
+    Returns: The path of the cache for context["bibtex_file"].
+    """
+    path = os.path.abspath(context["bibtex_file"]).encode("utf-8")
+    name = "citation_vim_cache_" + hashlib.md5(path).hexdigest()[:16]
+    return os.path.join(context["cache_path"], name)
+
+
+def source_stamp(bibtex_file):
+    """
+    Returns: The (size, mtime_ns) of the bibtex file.
+    """
+    try:
+        stat = os.stat(bibtex_file)
+    except OSError:
+        raiseError("{} does not exist".format(bibtex_file))
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def content_digest(bibtex_file):
+    with stats.timer("content_digest"):
+        digest = hashlib.blake2b(digest_size=16)
+        with open(bibtex_file, "rb") as in_file:
+            for chunk in iter(lambda: in_file.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.digest()
+
+
+def read_cache(cache_file, settings):
+    """
+    Returns the library from the cache file, or None if there is no usable
+    cache for these settings.
+    """
+    if not os.path.isfile(cache_file):
+        stats.count("cache_miss")
+        return None
+    try:
+        with stats.timer("read_cache"):
+            reader = CacheReader(cache_file)
+    except (ValueError, struct.error):
+        stats.count("cache_miss")
+        return None
+    if reader.fingerprint != settings:
+        stats.count("cache_miss")
+        return None
+    stats.count("cache_hit")
+    return {
+        "items": reader,
+        "spans": reader.spans(),
+        "macros": reader.macros(),
+        "macro_spans": reader.macro_spans(),
+        "index": reader.token_index(),
+        "source": reader.source(),
+        "fingerprints": reader.fingerprints(),
+        "labels": reader.labels(),
+        "versions": reader.versions(),
+        "sort_keys": reader.sort_keys(),
+    }
+
+
+def version_stamps(versions):
+    """
+    Returns: The modification stamps of Zotero item versions, or None.
+    """
+    if versions is None:
+        return None
+    return [version.split(LIST_SEPARATOR, 1)[0] for version in versions]
+
+
+def write_cache(cache_file, library, settings):
+    """
+    Writes the cache file.
+
+    The file is written beside the target and renamed over it, so readers
+    that still have the previous cache mapped are unaffected.
+    """
+    with stats.timer("write_cache"):
+        _write_cache(cache_file, library, settings)
+
+
+def _write_cache(cache_file, library, settings):
+    items = library["items"]
+    strings = bytearray()
+    records = array("I")
+    pool = {}
+    for item in items:
+        for field in FIELDS:
+            value = _raw_value(item, field)
+            if field in POOLED_FIELDS:
+                offset = pool.get(value)
+                if offset is None:
+                    offset = pool[value] = len(strings)
+                    strings += value
+            else:
+                offset = len(strings)
+                strings += value
+            records.append(offset)
+            records.append(len(value))
+
+    sections = [
+        (b"fields", "\n".join(FIELDS).encode("utf-8")),
+        (b"records", _little_endian(records).tobytes()),
+        (b"strings", bytes(strings)),
+    ]
+    if library["spans"] is not None:
+        spans = [SPAN.pack(s.start, s.end, s.digest) for s in library["spans"]]
+        sections.append((b"spans", b"".join(spans)))
+    if library["macros"] is not None:
+        sections.append((b"macros", b"".join(library["macros"])))
+    if library.get("macro_spans") is not None:
+        spans = [MACRO_SPAN.pack(*span) for span in library["macro_spans"]]
+        sections.append((b"macro_spans", b"".join(spans)))
+    if library.get("versions") is not None:
+        sections.append((b"versions", "\n".join(library["versions"]).encode("utf-8")))
+    sections.extend(_index_sections(items))
+    sections.append((b"fingerprints", _fingerprint_section(items)))
+    for kind in LABEL_KINDS:
+        sections.extend(_label_sections(kind, build_labels(items, kind)))
+    sections.extend(_sort_sections(items, version_stamps(library.get("versions"))))
+    if library.get("source") is not None:
+        sections.append((b"source", SOURCE.pack(*library["source"])))
+
+    offset = HEADER.size + SECTION.size * len(sections)
+    header = [
+        HEADER.pack(
+            MAGIC,
+            CACHE_VERSION,
+            0,
+            settings,
+            len(items),
+            len(FIELDS),
+            len(sections),
+        )
+    ]
+    for name, data in sections:
+        header.append(SECTION.pack(name, offset, len(data)))
+        offset += len(data)
+
+    import tempfile
+
+    directory = os.path.dirname(os.path.abspath(cache_file))
+    handle, temp_file = tempfile.mkstemp(dir=directory, prefix=".citation_vim_")
+    try:
+        with os.fdopen(handle, "wb") as out_file:
+            out_file.write(b"".join(header))
+            for name, data in sections:
+                out_file.write(data)
+        os.replace(temp_file, cache_file)
+    except BaseException:
+        os.unlink(temp_file)
+        raise
+
+
+def _index_sections(items):
+    """
+    Returns: The sections of the search index, the vocabulary and for each
+    token the offset and length of its postings.
+    """
+    with stats.timer("build_index"):
+        vocabulary, postings = build_index(items)
+        offsets = array("I")
+        codes = array("I")
+        for token_postings in postings:
+            offsets.append(len(codes))
+            offsets.append(len(token_postings))
+            codes.extend(token_postings)
+    return [
+        (b"tokens", "\n".join(vocabulary).encode("utf-8")),
+        (b"token_offsets", _little_endian(offsets).tobytes()),
+        (b"postings", _little_endian(codes).tobytes()),
+    ]
+
+
+def _label_sections(kind, table):
+    prefix = LABEL_SECTIONS[kind]
+    return [
+        (prefix + b"_names", LIST_SEPARATOR.join(table.names).encode("utf-8")),
+        (prefix + b"_offsets", _little_endian(table._offsets).tobytes()),
+        (prefix + b"_postings", _little_endian(table._postings).tobytes()),
+    ]
+
+
+def _sort_sections(items, stamps):
+    """
+    Returns: The sections of the sort keys of the items, and of their order
+    in each sort mode. Numeric keys are uint32s, text keys one per line.
+    """
+    with stats.timer("sort_keys"):
+        sort_keys = build_sort_keys(items, stamps)
+        sections = []
+        for mode, (keys_name, order_name) in SORT_SECTIONS.items():
+            column = sort_keys.column(mode)
+            if column is None:
+                continue
+            if mode in NUMERIC_SORT_MODES:
+                data = _little_endian(column).tobytes()
+            else:
+                data = "\n".join(column).encode("utf-8")
+            sections.append((keys_name, data))
+            order = _little_endian(sort_keys.order(mode)).tobytes()
+            sections.append((order_name, order))
+    return sections
+
+
+def _fingerprint_section(items):
+    """
+    Returns: The duplicate fingerprints of the items, one line each.
+    """
+    tables = {}
+    lines = []
+    with stats.timer("fingerprints"):
+        for item in items:
+            if isinstance(item, CachedItem):
+                # Reused from the previous cache, which already has them
+                table = tables.get(item._reader)
+                if table is None:
+                    table = tables[item._reader] = item._reader.fingerprints()
+                if table is not None:
+                    lines.append(LIST_SEPARATOR.join(table[item._index]))
+                    continue
+            lines.append(LIST_SEPARATOR.join(duplicate_fingerprint(item)))
+    return "\n".join(lines).encode("utf-8")
+
+
+def _raw_value(item, field):
+    """
+    Returns: The utf-8 bytes stored for one field of an item.
+    """
+    if isinstance(item, CachedItem):
+        return item._reader.raw(item._index, field)
+    value = getattr(item, field, "")
+    if field == "collections":
+        value = LIST_SEPARATOR.join(value)
+    return value.encode("utf-8")
+
+
+def _little_endian(values):
+    if struct.pack("=I", 1) != struct.pack("<I", 1):
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+def _uint32s(view):
+    """
+    Returns: The little-endian uint32s of a memoryview, without copying them
+    when the host is little-endian too.
+    """
+    if struct.pack("=I", 1) != struct.pack("<I", 1):
+        return _little_endian(array("I", view.tobytes()))
+    return view.cast("I")
+
+
+class CacheReader(object):
+    """
+    Read-only, memory-mapped view of a cache file. Behaves as a sequence of
+    items whose fields are only decoded when they are accessed.
+    """
+
+    def __init__(self, cache_file):
+        with open(cache_file, "rb") as in_file:
+            self._buffer = mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ)
+        (
+            magic,
+            version,
+            _,
+            self.fingerprint,
+            self._count,
+            field_count,
+            section_count,
+        ) = HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC or version != CACHE_VERSION:
+            raise ValueError("Incompatible cache file")
+
+        self._sections = {}
+        for number in range(section_count):
+            name, offset, length = SECTION.unpack_from(
+                self._buffer, HEADER.size + number * SECTION.size
+            )
+            self._sections[name.rstrip(b"\x00")] = (offset, length)
+
+        fields = self.section(b"fields").decode("utf-8").split("\n")
+        if len(fields) != field_count:
+            raise ValueError("Corrupt cache file")
+        self._columns = dict((field, column) for column, field in enumerate(fields))
+        self._width = field_count
+        self._records = self._sections[b"records"][0]
+        self._strings = self._sections[b"strings"][0]
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("cache index out of range")
+        return CachedItem(self, index)
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield CachedItem(self, index)
+
+    def section(self, name):
+        """
+        Returns: The raw bytes of a section, or None if it is missing.
+        """
+        if name not in self._sections:
+            return None
+        offset, length = self._sections[name]
+        return self._buffer[offset : offset + length]
+
+    def has_field(self, field):
+        return field in self._columns
+
+    def raw(self, index, field):
+        """
+        Returns: The utf-8 bytes of one field of one entry.
+        """
+        if field not in self._columns:
+            return b""
+        record = self._records + (index * self._width + self._columns[field]) * 8
+        offset, length = struct.unpack_from("<II", self._buffer, record)
+        start = self._strings + offset
+        return self._buffer[start : start + length]
+
+    def value(self, index, field):
+        value = self.raw(index, field).decode("utf-8")
+        if field == "collections":
+            return [sys.intern(v) for v in value.split(LIST_SEPARATOR)] if value else []
+        if field in POOLED_FIELDS:
+            return sys.intern(value)
+        return value
+
+    def column(self, field):
+        """
+        Returns: The values of one field of every entry, decoded in one pass
+        over the records rather than one lookup per entry.
+        """
+        if field not in self._columns:
+            return [""] * self._count
+        records = _uint32s(self.view(b"records"))
+        start = self._columns[field] * 2
+        step = self._width * 2
+        data = self._buffer
+        base = self._strings
+        values = [
+            data[base + offset : base + offset + length].decode("utf-8")
+            for offset, length in zip(records[start::step], records[start + 1 :: step])
+        ]
+        if field == "collections":
+            return [
+                [sys.intern(v) for v in value.split(LIST_SEPARATOR)] if value else []
+                for value in values
+            ]
+        if field in POOLED_FIELDS:
+            return [sys.intern(value) for value in values]
+        return values
+
+    def spans(self):
+        """
+        Returns: The Spans entries were parsed from, or None.
+        """
+        if b"spans" not in self._sections:
+            return None
+        return SpanTable(self)
+
+    def macros(self):
+        data = self.section(b"macros")
+        if data is None:
+            return None
+        return [data[i : i + 8] for i in range(0, len(data), 8)]
+
+    def macro_spans(self):
+        """
+        Returns: The (start, end) of each @string and @preamble, or None.
+        """
+        data = self.section(b"macro_spans")
+        if data is None:
+            return None
+        return list(MACRO_SPAN.iter_unpack(data))
+
+    def versions(self):
+        """
+        Returns: The modification stamps of Zotero items, or None.
+        """
+        data = self.section(b"versions")
+        if data is None:
+            return None
+        return data.decode("utf-8").split("\n") if self._count else []
+
+    def source(self):
+        """
+        Returns: The (size, mtime_ns, digest) of the bibtex file, or None.
+        """
+        if b"source" not in self._sections:
+            return None
+        return SOURCE.unpack_from(self._buffer, self._sections[b"source"][0])
+
+    def fingerprints(self):
+        """
+        Returns: The duplicate fingerprints of the entries, or None.
+        """
+        if b"fingerprints" not in self._sections:
+            return None
+        return FingerprintTable(self)
+
+    def labels(self):
+        """
+        Returns: A dict of label kind to its LabelTable, or None.
+        """
+        labels = {}
+        for kind in LABEL_KINDS:
+            prefix = LABEL_SECTIONS[kind]
+            if prefix + b"_postings" not in self._sections:
+                return None
+            offsets = _uint32s(self.view(prefix + b"_offsets"))
+            names = self.section(prefix + b"_names").decode("utf-8")
+            names = names.split(LIST_SEPARATOR) if len(offsets) else []
+            postings = _uint32s(self.view(prefix + b"_postings"))
+            labels[kind] = LabelTable(names, offsets, postings)
+        return labels
+
+    def sort_keys(self):
+        """
+        Returns: The SortKeys of the entries, or None.
+        """
+        if b"order_date" not in self._sections:
+            return None
+        columns = {}
+        orders = {}
+        for mode, (keys_name, order_name) in SORT_SECTIONS.items():
+            if order_name not in self._sections:
+                columns[mode] = None
+            elif mode in NUMERIC_SORT_MODES:
+                columns[mode] = _uint32s(self.view(keys_name))
+            else:
+                columns[mode] = self.section(keys_name)
+            if order_name in self._sections:
+                orders[mode] = _uint32s(self.view(order_name))
+        return SortKeys(
+            self._count,
+            columns["date"],
+            columns["modified"],
+            columns["author"],
+            columns["title"],
+            orders,
+        )
+
+    def token_index(self):
+        """
+        Returns: The TokenIndex of the entries, or None.
+        """
+        if b"postings" not in self._sections:
+            return None
+        return TokenIndex(
+            self.section(b"tokens").decode("utf-8"),
+            _uint32s(self.view(b"token_offsets")),
+            _uint32s(self.view(b"postings")),
+        )
+
+    def view(self, name):
+        """
+        Returns: A memoryview of a section, mapped rather than copied.
+        """
+        offset, length = self._sections[name]
+        return memoryview(self._buffer)[offset : offset + length]
+
+
+class SpanTable(object):
+    """
+    Sequence of the Spans stored in a cache file, unpacked on access.
+    """
+
+    def __init__(self, reader):
+        self._reader = reader
+        self._offset = reader._sections[b"spans"][0]
+
+    def __len__(self):
+        return len(self._reader)
+
+    def __getitem__(self, index):
+        # Spans are only read to re-parse, so the scanner isn't imported before
+        from citation_vim.bibtex.scanner import Span
+
+        if not 0 <= index < len(self._reader):
+            raise IndexError("span index out of range")
+        start, end, digest = SPAN.unpack_from(
+            self._reader._buffer, self._offset + index * SPAN.size
+        )
+        return Span(
+            self._reader.value(index, "type"),
+            self._reader.value(index, "key"),
+            start,
+            end,
+            digest,
+        )
+
+    def __iter__(self):
+        for index in range(len(self._reader)):
+            yield self[index]
+
+
+class FingerprintTable(object):
+    """
+    Sequence of the duplicate fingerprints stored in a cache file, decoded
+    on first access.
+    """
+
+    def __init__(self, reader):
+        self._reader = reader
+        self._rows = None
+
+    def __len__(self):
+        return len(self._reader)
+
+    def __getitem__(self, index):
+        if self._rows is None:
+            data = self._reader.section(b"fingerprints").decode("utf-8")
+            lines = data.split("\n") if len(self._reader) else []
+            self._rows = [tuple(line.split(LIST_SEPARATOR)) for line in lines]
+        return self._rows[index]
+
+
+class CachedItem(Item):
+    """
+    Item backed by a cache file, fields are read on first access. Large
+    fields and the combined text are read again on every access.
+    """
+
+    __slots__ = ("_reader", "_index")
+
+    def __init__(self, reader, index):
+        self._reader = reader
+        self._index = index
+
+    def __getattr__(self, name):
+        if name.startswith("_") or not self._reader.has_field(name):
+            raise AttributeError(name)
+        value = self._reader.value(self._index, name)
+        if name not in LARGE_FIELDS:
+            setattr(self, name, value)
+        return value
+
+    @property
+    def combined(self):
+        with stats.timer("combine"):
+            return self._combine()
+
+
+class CacheLock(object):
+    """
+    Advisory lock held while a cache file is rebuilt, so that only one Vim
+    instance parses a changed bibtex file. Always acquired where fcntl is
+    unavailable.
+    """
+
+    def __init__(self, cache_file):
+        self.path = cache_file + ".lock"
+        self._file = None
+
+    def acquire(self, blocking=True):
+        """
+        Returns: Whether the lock was acquired.
+        """
+        if fcntl is None:
+            return True
+        self._file = open(self.path, "a")
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            with stats.timer("cache_lock"):
+                fcntl.flock(self._file.fileno(), flags)
+        except BlockingIOError:
+            self._file.close()
+            self._file = None
+            return False
+        return True
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
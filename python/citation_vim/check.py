@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+import re
+from citation_vim import stats
+
+# LaTeX \cite{a,b}, \parencite[p. 1]{a} and \nocite{a}, or Pandoc's @a, -@a
+# and @{a}. An @ after a word, dot or backslash is an address or a macro.
+CITATION = re.compile(
+    r"\\[A-Za-z]*cite[A-Za-z]*\*?(?:\[[^\]]*\]){0,2}\{([^}]*)\}"
+    r"|(?<![\w.\\@])-?@(?:\{([^}]+)\}|(\w(?:[\w:.#$%&+?<>~/-]*\w)?))"
+)
+
+
+def get_citations(lines):
+    """
+    Returns: An array of (line number, column, key) of every citation in the
+    lines, both numbered from 1. Columns are byte offsets, as in quickfix.
+    """
+    citations = []
+    for number, line in enumerate(lines, 1):
+        if "cite" not in line and "@" not in line:
+            continue
+        for match in CITATION.finditer(line):
+            if match.group(1) is not None:
+                start = match.start(1)
+                for key in match.group(1).split(","):
+                    stripped = key.strip()
+                    if stripped and stripped != "*":
+                        column = start + len(key) - len(key.lstrip())
+                        column = _byte_column(line, column)
+                        citations.append((number, column, stripped))
+                    start += len(key) + 1
+            else:
+                group = 2 if match.group(2) is not None else 3
+                column = _byte_column(line, match.start(group))
+                citations.append((number, column, match.group(group).strip()))
+    return citations
+
+
+def _byte_column(line, index):
+    return len(line[:index].encode("utf-8")) + 1
+
+
+def check_lines(lines, key_index):
+    """
+    Returns: Quickfix entries for the citations in lines that match no item,
+    or more than one.
+    """
+    entries = []
+    with stats.timer("check_lines"):
+        citations = get_citations(lines)
+        for number, column, key in citations:
+            count = len(key_index.resolve(key))
+            if count == 1:
+                continue
+            if count == 0:
+                text, kind = "Undefined citation key: %s" % key, "E"
+            else:
+                text = "Ambiguous citation key: %s (%d entries)" % (key, count)
+                kind = "W"
+            entries.append({"lnum": number, "col": column, "text": text, "type": kind})
+    stats.count("citations_checked", len(citations))
+    return entries
+
+
+def check_buffer(vim, lines):
+    """
+    Returns: Quickfix entries for the unresolved and ambiguous citations in
+    the lines of a buffer, resolved against the library of the Vim settings.
+    """
+    from citation_vim.library import get_vim_library
+
+    return check_lines(lines, get_vim_library(vim).key_index())
+
+
+class KeyIndex(object):
+    """
+    Hash index of the items of a library by key, and by nick for citations
+    that use it instead.
+    """
+
+    def __init__(self, items):
+        self.keys = {}
+        self.nicks = {}
+        for index, item in enumerate(items):
+            _add(self.keys, item.key, index)
+            if item.nick:
+                _add(self.nicks, item.nick, index)
+
+    def resolve(self, key):
+        """
+        Returns: The indexes of the items a citation key refers to.
+        """
+        indexes = self.keys.get(key)
+        if indexes is None:
+            indexes = self.nicks.get(key)
+            if indexes is None:
+                return []
+        return indexes if isinstance(indexes, list) else [indexes]
+
+
+def _add(table, name, index):
+    # Names are mostly unique, only shared ones take a list
+    existing = table.get(name)
+    if existing is None:
+        table[name] = index
+    elif isinstance(existing, list):
+        existing.append(index)
+    else:
+        table[name] = [existing, index]
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+from json.encoder import encode_basestring
+from citation_vim import stats
+from citation_vim.cache import get_cache_file
+from citation_vim.check import get_citations
+from citation_vim.context_loader import DEFAULTS, ContextLoader
+from citation_vim.item import FIELDS
+from citation_vim.library import get_library
+from citation_vim.search import SEARCH_FIELDS
+from citation_vim.utils import raiseError
+
+# Fields written for each entry unless others are asked for
+DEFAULT_FIELDS = ("key", "author", "date", "title")
+
+# Rows are written to the output in batches of this many
+BATCH_SIZE = 1000
+
+# Fields are read for all items at once when at least 1 in this many are
+# written
+BULK_FRACTION = 4
+
+# Characters that would split a TSV value
+TSV_SPACES = str.maketrans("\t\r\n", "   ")
+
+
+def get_cli_library(variables):
+    """
+    Returns: The resident Library for g:citation_vim_* style variables, so
+    the command line shares the parser, settings and cache of the plugin.
+    """
+    context = dict(DEFAULTS)
+    context.update(ContextLoader(None, variables).context)
+    return get_library(context)
+
+
+def check_fields(fields):
+    """
+    Returns: The fields, after checking they are fields of an item.
+    """
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown:
+        raiseError(
+            "Unknown fields {}, choose from {}".format(
+                ", ".join(unknown), ", ".join(FIELDS)
+            )
+        )
+    return fields
+
+
+def query(library, words, mode="file"):
+    """
+    Returns: The indexes of the items matching every word, best first as
+    ranked by sorter_citation and ties in the order of the sort mode. All
+    the items in that order if there are no words.
+    """
+    items = library.get_items()
+    order = library.order(mode)
+    if not words:
+        return order
+    index = library.peek_index()
+    totals = None
+    for word in words:
+        word = word.lower()
+        scores = index.match(word) if index is not None else None
+        if scores is None:
+            # Too short to look up, matched against the searched fields
+            candidates = range(len(items)) if totals is None else totals
+            scores = dict(
+                (number, 1) for number in candidates if _contains(items[number], word)
+            )
+        if totals is None:
+            totals = dict(scores)
+        else:
+            totals = dict(
+                (number, total + scores[number])
+                for number, total in totals.items()
+                if number in scores
+            )
+    if mode == "file":
+        return sorted(totals, key=lambda number: (-totals[number], number))
+    position = dict(
+        (number, rank) for rank, number in enumerate(order) if number in totals
+    )
+    return sorted(totals, key=lambda number: (-totals[number], position[number]))
+
+
+def _contains(item, word):
+    return any(word in getattr(item, field).lower() for field, _ in SEARCH_FIELDS)
+
+
+def query_rows(library, words, fields, mode="file", limit=0):
+    """
+    Yields: A dict of the fields of each item matching the words.
+    """
+    items = library.get_items()
+    indexes = query(library, words, mode)
+    if limit:
+        indexes = indexes[:limit]
+    if len(indexes) * BULK_FRACTION < len(items):
+        for index in indexes:
+            item = items[index]
+            yield dict((field, getattr(item, field)) for field in fields)
+        return
+    # Most of the library, each field is read in one pass
+    columns = [library.column(field) for field in fields]
+    if indexes != range(len(items)):
+        columns = [[column[index] for index in indexes] for column in columns]
+    for values in zip(*columns):
+        yield dict(zip(fields, values))
+
+
+def key_rows(library, keys, fields):
+    """
+    Yields: For each key, whether it is "found", "missing" or "ambiguous",
+    with the fields of the first item it refers to.
+    """
+    items = library.get_items()
+    key_index = library.key_index()
+    for key in dict.fromkeys(keys):
+        indexes = key_index.resolve(key)
+        row = {"query": key, "status": "found"}
+        if not indexes:
+            row["status"] = "missing"
+        elif len(indexes) > 1:
+            row["status"] = "ambiguous"
+        for field in fields:
+            row[field] = getattr(items[indexes[0]], field) if indexes else ""
+        yield row
+
+
+def cited_keys(paths):
+    """
+    Returns: The keys cited in LaTeX or Markdown files, in order.
+    """
+    keys = []
+    for path in paths:
+        with open(path, encoding="utf-8") as in_file:
+            lines = in_file.read().splitlines()
+        keys.extend(key for _, _, key in get_citations(lines))
+    return keys
+
+
+def duplicate_rows(library):
+    """
+    Yields: A row for each entry of each group of duplicate entries, with
+    what they share and the bibtex file they are in.
+    """
+    items = library.get_items()
+    for group, (kind, value, indexes) in enumerate(library.duplicate_groups(), 1):
+        for index in indexes:
+            bib_file, _ = library.locate(index)
+            yield {
+                "group": group,
+                "kind": kind,
+                "value": value,
+                "key": items[index].key,
+                "title": items[index].title,
+                "file": bib_file.path,
+            }
+
+
+def stats_rows(library):
+    """
+    Yields: A row for each bibtex file and one for the whole library, with
+    their number of entries, tags, collections and cache size, and the
+    duplicates of the library.
+    """
+    library.get_items()
+    totals = {"file": "total", "entries": 0, "tags": 0, "collections": 0}
+    totals["cache_bytes"] = 0
+    for bib_file in library.files:
+        cache_file = get_cache_file(bib_file.context)
+        row = {
+            "file": bib_file.path,
+            "entries": len(bib_file.items),
+            "tags": len(bib_file.labels["tags"].names),
+            "collections": len(bib_file.labels["collections"].names),
+            "cache_bytes": (
+                os.path.getsize(cache_file) if os.path.isfile(cache_file) else 0
+            ),
+            # Only counted across the whole library
+            "duplicate_groups": None,
+            "duplicate_keys": None,
+        }
+        totals["entries"] += row["entries"]
+        totals["cache_bytes"] += row["cache_bytes"]
+        yield row
+    totals["tags"] = len(library.label_counts("tags"))
+    totals["collections"] = len(library.label_counts("collections"))
+    totals["duplicate_groups"] = len(library.duplicate_groups())
+    totals["duplicate_keys"] = len(library.duplicates)
+    yield totals
+
+
+def write_rows(out_file, rows, output="jsonl", header=False):
+    """
+    Writes rows as JSON lines, or as tab separated values in the order of
+    the keys of the first row, after a line of their names if header is
+    set. Tabs and line breaks in TSV values are replaced with spaces.
+    """
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    batch = []
+    columns = None
+    template = None
+    for row in rows:
+        if output == "jsonl":
+            if columns is None:
+                columns = list(row)
+                template = _json_template(columns)
+            batch.append(_json_line(row, columns, template, encode))
+        else:
+            if columns is None:
+                columns = list(row)
+                if header:
+                    batch.append("\t".join(columns))
+            batch.append(_tsv_line(row, columns))
+        if len(batch) >= BATCH_SIZE:
+            out_file.write("\n".join(batch) + "\n")
+            batch = []
+    if batch:
+        out_file.write("\n".join(batch) + "\n")
+    out_file.flush()
+    stats.flush("cli")
+
+
+def _json_template(columns):
+    """
+    Returns: A %-format of a JSON object with the columns as keys, laid out
+    as json.JSONEncoder writes it, for rows of strings.
+    """
+    return "{%s}" % ", ".join(
+        "%s: %%s" % encode_basestring(name).replace("%", "%%") for name in columns
+    )
+
+
+def _json_line(row, columns, template, encode):
+    # Most rows are the text fields of an item, they are filled in without
+    # walking the row through the encoder
+    try:
+        values = [row[name] for name in columns]
+    except KeyError:
+        values = None
+    if values is None or len(row) != len(columns):
+        return encode(row)
+    try:
+        return template % tuple(map(encode_basestring, values))
+    except TypeError:
+        return encode(row)
+
+
+def _tsv_line(row, columns):
+    try:
+        line = "\t".join([row[name] for name in columns])
+    except (KeyError, TypeError):
+        line = None
+    # Most rows are plain text, the others are converted value by value
+    if line is None or line.count("\t") >= len(columns) or _has_break(line):
+        line = "\t".join(_tsv_value(row.get(name)) for name in columns)
+    return line
+
+
+def _has_break(line):
+    return "\n" in line or "\r" in line
+
+
+def _tsv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        value = ", ".join(value)
+    return str(value).translate(TSV_SPACES)
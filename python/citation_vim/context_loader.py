@@ -1,81 +1,182 @@
 # -*- coding: utf-8 -*-
 
 import os.path
-import pynvim as vim
 import re
+import string
+from citation_vim.keys import TOKENS
+from citation_vim.sorting import MODES as SORT_MODES
 from citation_vim.utils import raiseError, decode_str
 
+# Library settings that aren't set in Vim. The Denite source starts from
+# these, as do commands that load the library outside of it.
+DEFAULTS = {
+    "cache_path": "",
+    "mode": "bibtex",
+    "bibtex_file": "bibtex.bib",
+    "bibtex_files": [],
+    "parse_workers": 0,
+    "parser": "pybtex",
+    "et_al_limit": 5,
+    "key_format": "",
+    "key_clean_regex": r"[^A-Za-z0-9\!\$\&\*\+\-\.\/\:\;\<\>\?\[\]\^\_\`\|]+",
+    "key_title_banned_regex": r"\b(a|an|the|some|from|on|in|to|of|do|with|der|die|das|ein|eine|einer|eines|einem|einen|un|une|la|le|l|el|las|los|al|uno|una|unos|unas|de|des|del|d)\W",
+}
+
+# The last g:citation_vim_* values read and the context derived from them.
+_last_variables = None
+_last_context = None
+
 
 class ContextLoader(object):
     """
     Loads context from Vim
     """
 
-    def __init__(self, vim):
+    def __init__(self, vim, variables=None):
+        global _last_variables, _last_context
         self.vim = vim
-        context = {}
-        context = self.get_mode(context)
-        context = self.get_shared_context(context)
-        self.context = context
+        # One round trip for every g:citation_vim_* variable, unless they
+        # are given without Vim, by the command line
+        if variables is None:
+            variables = self.vim.call("citation#context")
+        if variables != _last_variables:
+            context = {}
+            context = self.get_mode(context, variables)
+            context = self.get_shared_context(context, variables)
+            _last_variables, _last_context = variables, context
+        self.context = dict(_last_context)
+        # Globs are expanded on every load, to pick up new bibtex files
+        if self.context["mode"] == "bibtex":
+            self.get_bibtex_context(self.context, variables)
 
-    def get_mode(self, context):
-        context["mode"] = self.vim.eval("g:citation_vim_mode")
+    def get_mode(self, context, variables):
+        context["mode"] = decode_str(variables.get("citation_vim_mode", ""))
         if context["mode"] == "bibtex":
-            context = self.get_bibtex_context(context)
+            context = self.get_bibtex_context(context, variables)
+        elif context["mode"] == "zotero":
+            context = self.get_zotero_context(context, variables)
         else:
-            raiseError("'g:citation_vim_mode' must be set to 'bibtex'")
+            raiseError("'g:citation_vim_mode' must be set to 'bibtex' or 'zotero'")
+        return context
+
+    def get_bibtex_context(self, context, variables):
+        context["bibtex_files"] = self.get_bibtex_files(variables)
+        context["bibtex_file"] = (context["bibtex_files"] or [""])[0]
+        context["cache"] = True
+        context["cache_path"] = self.get_cache_path(variables)
         return context
 
-    def get_bibtex_context(self, context):
-        context["bibtex_file"] = self.get_bibtex_file()
+    def get_zotero_context(self, context, variables):
+        """
+        Returns: The context for reading zotero.sqlite directly. It stands in
+        for the bibtex file, so it is cached and reloaded the same way.
+        """
+        zotero_path = os.path.expanduser(
+            decode_str(variables.get("citation_vim_zotero_path", "~/Zotero"))
+        )
+        context["zotero_path"] = zotero_path
+        context["zotero_attachment_path"] = os.path.expanduser(
+            decode_str(variables.get("citation_vim_zotero_attachment_path", ""))
+        )
+        context["bibtex_files"] = [os.path.join(zotero_path, "zotero.sqlite")]
+        context["bibtex_file"] = context["bibtex_files"][0]
         context["cache"] = True
-        context["cache_path"] = self.get_cache_path()
+        context["cache_path"] = self.get_cache_path(variables)
         return context
 
-    def get_shared_context(self, context):
+    def get_shared_context(self, context, variables):
         keys_to_check = {
-            "key_clean_regex": "g:citation_vim_key_clean_regex",
-            "key_title_banned_regex": "g:citation_vim_key_title_banned_regex",
-            "collection": "g:citation_vim_collection",
-            "key_format": "g:citation_vim_key_format",
-            "reverse_order": "g:citation_vim_reverse_order",
-            "wrap_chars": "g:citation_vim_source_wrap",
-            "desc_format": "g:citation_vim_description_format",
-            "et_al_limit": "g:citation_vim_et_al_limit",
-            "desc_fields": "g:citation_vim_description_fields",
-            "source": "a:source",
-            "source_field": "a:field",
+            "key_clean_regex": "citation_vim_key_clean_regex",
+            "key_title_banned_regex": "citation_vim_key_title_banned_regex",
+            "collection": "citation_vim_collection",
+            "key_format": "citation_vim_key_format",
+            "reverse_order": "citation_vim_reverse_order",
+            "sort": "citation_vim_sort",
+            "wrap_chars": "citation_vim_source_wrap",
+            "desc_format": "citation_vim_description_format",
+            "et_al_limit": "citation_vim_et_al_limit",
+            "desc_fields": "citation_vim_description_fields",
+            "parser": "citation_vim_parser",
+            "batch_size": "citation_vim_batch_size",
+            "match_limit": "citation_vim_match_limit",
+            "parse_workers": "citation_vim_parse_workers",
+            "stats": "citation_vim_stats",
+            "stats_log": "citation_vim_stats_log",
+            "warmup_delay": "citation_vim_warmup_delay",
         }
 
         for key, vim_var in keys_to_check.items():
-            try:
-                value = self.vim.eval(vim_var)
-                if key in ["reverse_order", "et_al_limit"]:
-                    value = int(decode_str(value))
-                elif key in ["key_clean_regex", "key_title_banned_regex"]:
-                    value = re.compile(decode_str(value))
-                else:
-                    value = decode_str(value)
-                context[key] = value
-            except vim.api.common.NvimError:
-                pass  # Key does not exist, do nothing
+            if vim_var not in variables:
+                continue  # Key does not exist, do nothing
+            value = variables[vim_var]
+            if key in [
+                "reverse_order",
+                "et_al_limit",
+                "batch_size",
+                "match_limit",
+                "parse_workers",
+                "stats",
+                "stats_log",
+                "warmup_delay",
+            ]:
+                value = int(decode_str(value))
+            elif key in ["key_clean_regex", "key_title_banned_regex"]:
+                value = re.compile(decode_str(value))
+            else:
+                value = decode_str(value)
+            context[key] = value
 
+        if context.get("sort", "file") not in SORT_MODES:
+            raiseError("'g:citation_vim_sort' must be one of " + ", ".join(SORT_MODES))
+        if context.get("key_format"):
+            self.check_key_format(context["key_format"])
         # Defaults set in plugin
-        context["bibtex_file"] = self.get_bibtex_file()
-        context["cache_path"] = self.get_cache_path()
-        context["review_directory"] = self.get_review_directory()
+        context["review_directory"] = self.get_review_directory(variables)
         return context
 
-    def get_review_directory(self):
-        file = self.vim.eval("g:citation_vim_review_directory")
-        return os.path.expanduser(file)
+    def check_key_format(self, key_format):
+        """
+        Raises an error if the key format has placeholders other than the
+        tokens KeyGenerator renders.
+        """
+        try:
+            names = [name for _, name, _, _ in string.Formatter().parse(key_format)]
+        except ValueError as error:
+            raiseError("'g:citation_vim_key_format' is invalid: {}".format(error))
+        unknown = [name for name in names if name is not None and name not in TOKENS]
+        if unknown:
+            raiseError(
+                "Unknown 'g:citation_vim_key_format' tokens {}, choose from {}".format(
+                    ", ".join("{%s}" % name for name in unknown),
+                    ", ".join("{%s}" % name for name in TOKENS),
+                )
+            )
 
-    def get_bibtex_file(self):
-        file = self.vim.eval("g:citation_vim_bibtex_file")
+    def get_review_directory(self, variables):
+        file = variables.get("citation_vim_review_directory", "")
         return os.path.expanduser(file)
 
-    def get_cache_path(self):
-        return os.path.expanduser(self.vim.eval("g:citation_vim_cache_path"))
+    def get_bibtex_files(self, variables):
+        """
+        Returns: The bibtex files, from a path, glob or list of these.
+        """
+        patterns = variables.get("citation_vim_bibtex_file", "")
+        if not isinstance(patterns, list):
+            patterns = [patterns]
+        files = []
+        for pattern in patterns:
+            pattern = os.path.expanduser(decode_str(pattern))
+            if any(char in pattern for char in "*?["):
+                import glob
+
+                matches = sorted(glob.glob(pattern))
+            else:
+                matches = [pattern] if pattern else []
+            files.extend(path for path in matches if path not in files)
+        return files
+
+    def get_cache_path(self, variables):
+        return os.path.expanduser(variables.get("citation_vim_cache_path", ""))
 
     def get_searchkeys(self):
         searchkeys = self.vim.eval("l:searchkeys")
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import re
+import unicodedata
+
+# What entries are grouped by, in the order duplicate groups are reported.
+KINDS = ("key", "doi", "isbn", "title")
+
+DOI_PREFIX = re.compile(r"^(?:https?://(?:dx\.)?doi\.org/|doi:\s*)", re.I)
+NOT_ISBN = re.compile(r"[^0-9X]")
+NOT_WORD = re.compile(r"[\W_]+")
+FIRST_AUTHOR = re.compile(r",| & | et al\.")
+YEAR = re.compile(r"\d{4}")
+
+
+def fingerprint(item):
+    """
+    Returns: The normalized (doi, isbn, title) of an item, each "" if the
+    item doesn't have one. The title fingerprint includes the surname of
+    the first author and the year.
+    """
+    doi = DOI_PREFIX.sub("", item.doi.strip()).lower()
+    return (doi, normalize_isbn(item.isbn), title_fingerprint(item))
+
+
+def normalize_isbn(isbn):
+    """
+    Returns: The ISBN-13 digits of an ISBN-10 or ISBN-13.
+    """
+    digits = NOT_ISBN.sub("", isbn.upper())
+    if len(digits) == 10 and digits[:9].isdigit():
+        digits = "978" + digits[:9]
+        total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits))
+        digits += str(-total % 10)
+    return digits
+
+
+def title_fingerprint(item):
+    title = _words(item.title)
+    if not title:
+        return ""
+    author = _words(FIRST_AUTHOR.split(item.author)[0]).split()
+    year = YEAR.search(item.date)
+    return " ".join(
+        [title, "/", author[-1] if author else "", "/", year.group() if year else ""]
+    )
+
+
+def _words(text):
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return NOT_WORD.sub(" ", text).strip()
+
+
+def find_duplicates(items, fingerprints=None):
+    """
+    Returns: An array of (kind, value, indexes) for every key, DOI, ISBN or
+    title fingerprint shared by more than one item. Keys are compared
+    ignoring case, as BibTeX does. Groups with the same items as an earlier
+    one are left out.
+    """
+    buckets = dict((kind, {}) for kind in KINDS)
+    for index, item in enumerate(items):
+        if fingerprints is None:
+            values = (item.key.lower(),) + fingerprint(item)
+        else:
+            values = (item.key.lower(),) + tuple(fingerprints[index])
+        for kind, value in zip(KINDS, values):
+            if value:
+                buckets[kind].setdefault(value, []).append(index)
+
+    groups = []
+    seen = set()
+    for kind in KINDS:
+        for value, indexes in buckets[kind].items():
+            if len(indexes) > 1 and tuple(indexes) not in seen:
+                seen.add(tuple(indexes))
+                groups.append((kind, value, indexes))
+    return groups
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+import mmap
+import re
+from citation_vim import stats
+from citation_vim.bibtex.scanner import BLOCK_START, FIELD_START, MACRO_TYPES
+from citation_vim.bibtex.scanner import digest, scan_spans
+from citation_vim.check import get_citations
+from citation_vim.utils import raiseError
+
+# A bare word after = or #, in a field value or @string, names a macro.
+MACRO_REFERENCE = re.compile(rb"[=#][ \t\r\n]*([A-Za-z_][^\s\"#%'(),={}]*)")
+
+
+def export_keys(library, keys, out_file):
+    """
+    Returns: The keys that match no entry, after writing the entries of the
+    others to out_file with the @string macros they use and the @preambles
+    of their files. Entries are copied byte for byte from a memory map of
+    their bibtex file, in file order.
+    """
+    if library.context.get("mode") == "zotero":
+        raiseError("Exporting needs 'g:citation_vim_mode' set to 'bibtex'")
+    key_index = library.key_index()
+    wanted = {}
+    missing = []
+    for key in dict.fromkeys(keys):
+        indexes = key_index.resolve(key)
+        if not indexes:
+            missing.append(key)
+            continue
+        bib_file, index = library.locate(indexes[0])
+        wanted.setdefault(bib_file, set()).add(index)
+
+    blocks = []
+    with stats.timer("export"):
+        for bib_file in library.files:
+            if bib_file in wanted:
+                blocks.extend(export_file(bib_file, sorted(wanted[bib_file])))
+    with open(out_file, "wb") as out:
+        out.write(b"\n\n".join(blocks) + b"\n" if blocks else b"")
+    stats.count("entries_exported", sum(len(indexes) for indexes in wanted.values()))
+    return missing
+
+
+def export_buffer(vim, lines, out_file):
+    """
+    Returns: The keys cited in the lines of a buffer that match no entry,
+    after writing the entries of the others to out_file.
+    """
+    from citation_vim.library import get_vim_library
+
+    keys = [key for _, _, key in get_citations(lines)]
+    return export_keys(get_vim_library(vim), keys, out_file)
+
+
+def export_file(bib_file, indexes):
+    """
+    Returns: The raw bytes of the entries of a bibtex file at indexes, after
+    the macros they need.
+    """
+    with open(bib_file.path, "rb") as in_file:
+        with mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            entries, macros = _spans(bib_file, indexes, data)
+            blocks = [data[start:end] for start, end in entries]
+            return _needed_macros(data, macros, blocks) + blocks
+
+
+def _spans(bib_file, indexes, data):
+    """
+    Returns: The (start, end) of the entries at indexes and of the macros of
+    the file. The offsets in the cache are used when the entries are still
+    where they were, otherwise the file is scanned for its blocks.
+    """
+    spans = bib_file.spans
+    if spans is not None and bib_file.macro_spans is not None:
+        entries = []
+        for index in indexes:
+            span = spans[index]
+            moved = span.end > len(data)
+            if moved or digest(data[span.start : span.end]) != span.digest:
+                break
+            entries.append((span.start, span.end))
+        else:
+            return entries, bib_file.macro_spans
+    stats.count("export_scanned")
+    by_key = {}
+    macros = []
+    for span in scan_spans(data):
+        if span.type in MACRO_TYPES:
+            macros.append((span.start, span.end))
+        else:
+            by_key.setdefault(span.key, (span.start, span.end))
+    entries = [by_key.get(bib_file.items[i].key) for i in indexes]
+    return [span for span in entries if span is not None], macros
+
+
+def _needed_macros(data, macros, blocks):
+    """
+    Returns: The raw bytes of every @preamble, and of the @strings the
+    blocks use directly or through other @strings, in file order.
+    """
+    defined = {}
+    preambles = []
+    for start, end in macros:
+        match = BLOCK_START.match(data, start)
+        if match.group(1).lower() == b"string":
+            name = FIELD_START.match(data, match.end())
+            if name is not None:
+                defined[name.group(1).lower()] = (start, end)
+        else:
+            preambles.append((start, end))
+
+    needed = set()
+    pending = list(blocks)
+    while pending:
+        for reference in MACRO_REFERENCE.findall(pending.pop()):
+            name = reference.lower()
+            if name in defined and name not in needed:
+                needed.add(name)
+                start, end = defined[name]
+                pending.append(data[start:end])
+    spans = sorted(preambles + [defined[name] for name in needed])
+    return [data[start:end] for start, end in spans]
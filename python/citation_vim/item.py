@@ -1,19 +1,116 @@
 # -*- coding: utf-8 -*-
 
 import collections
+from citation_vim import stats
 from citation_vim.utils import strip_braces
 
+# Fields of an item, in the order they are cached.
+FIELDS = (
+    "key",
+    "nick",
+    "zotero_key",
+    "type",
+    "author",
+    "title",
+    "date",
+    "tags",
+    "collections",
+    "publication",
+    "issue",
+    "volume",
+    "pages",
+    "publisher",
+    "language",
+    "abstract",
+    "notes",
+    "file",
+    "url",
+    "doi",
+    "isbn",
+)
+
+
+# Description renderers, by the settings they were compiled for.
+_renderers = {}
+
+
+def get_renderer(context):
+    """
+    Returns: A function rendering the description of an item, compiled once
+    for the description settings of the context.
+    """
+    signature = (
+        context["desc_format"],
+        tuple(context["desc_fields"]),
+        context["source_field"],
+        context["wrap_chars"],
+    )
+    renderer = _renderers.get(signature)
+    if renderer is None:
+        renderer = _renderers[signature] = _compile_renderer(*signature)
+    return renderer
+
+
+def _compile_renderer(desc_format, desc_fields, source_field, wrap_chars):
+    prefix, suffix = wrap_chars[0], wrap_chars[1]
+    render_format = desc_format.format
+    wrapped = desc_fields.index(source_field) if source_field in desc_fields else -1
+    append = wrapped == -1 and source_field != "combined"
+
+    def render(item):
+        values = [strip_braces(getattr(item, field, "")) for field in desc_fields]
+        if wrapped != -1:
+            values[wrapped] = prefix + values[wrapped] + suffix
+        description = render_format(*values)
+        if append:
+            description += prefix + item.get_field_value(source_field) + suffix
+        return description
+
+    return render
+
+
+def _restore(state):
+    item = Item()
+    for field, value in state.items():
+        setattr(item, field, value)
+    return item
+
 
 class Item(object):
     """
     Intermediary object between a bibtex/zotero item and a row in unite source output.
     """
 
+    __slots__ = FIELDS + ("_combined",)
+
     def __init__(self):
         self.zotero_key = ""
         self.nick = ""
 
+    def __reduce__(self):
+        # Pickle the fields only, never the combined text
+        state = {}
+        for field in FIELDS:
+            if hasattr(self, field):
+                state[field] = getattr(self, field)
+        return (_restore, (state,))
+
+    @property
+    def combined(self):
+        """
+        Text listing all available fields, built on first access.
+        """
+        try:
+            return self._combined
+        except AttributeError:
+            self.combine()
+            return self._combined
+
     def combine(self):
+        with stats.timer("combine"):
+            self._combined = self._combine()
+
+    def _combine(self):
         pairs = collections.OrderedDict(
             [
                 ("Key", self.key),
@@ -39,44 +136,18 @@ class Item(object):
                 ("Zotero key", self.zotero_key),
             ]
         )
-        self.combined = "Available citation fields:\n"
+        combined = "Available citation fields:\n"
         for key, value in pairs.items():
             if value:
-                self.combined += "  " + key + " : " + str(value) + "\n"
+                combined += "  " + key + " : " + str(value) + "\n"
+        return combined
 
     def describe(self, context):
         """
-        Returns visible text descriptions for unite, from user selected fields.
-        """
-        self.context = context
-        desc_values = self.get_description_values()
-        return self.describe_with_source_field(desc_values)
-
-    def get_description_values(self):
-        desc_fields = self.context["desc_fields"]
-        desc_values = []
-        for desc_field in desc_fields:
-            val = self.get_field_value(desc_field)
-            desc_values.append(val)
-        return desc_values
-
-    def describe_with_source_field(self, desc_values):
+        Returns visible text descriptions for unite, from user selected fields,
+        with the source field wrapped.
         """
-        Returns description with added/replaced wrapped source field
-        """
-        desc_fields = self.context["desc_fields"]
-        desc_format = self.context["desc_format"]
-        source_field = self.context["source_field"]
-        wrapped_value = self.wrap(self.get_field_value(source_field))
-        if source_field in desc_fields:
-            desc_values[desc_fields.index(source_field)] = wrapped_value
-        elif source_field not in ["combined"]:
-            desc_format += wrapped_value
-        return desc_format.format(*desc_values)
+        return get_renderer(context)(self)
 
     def get_field_value(self, field):
-        return strip_braces(getattr(self, field)) if hasattr(self, field) else ""
-
-    def wrap(self, string):
-        wrapper = self.context["wrap_chars"]
-        return "%s%s%s" % (wrapper[0], string, wrapper[1])
+        return strip_braces(getattr(self, field, ""))
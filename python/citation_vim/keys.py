@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+import re
+import string
+from citation_vim.duplicates import FIRST_AUTHOR
+from citation_vim.utils import strip_accents
+
+# Placeholders g:citation_vim_key_format can use
+TOKENS = ("author", "Author", "title", "Title", "date", "year")
+
+
+class KeyGenerator(object):
+    """
+    Renders g:citation_vim_key_format for items, e.g. "{author}{date}{title}".
+    Tokens are {author} and {Author}, the first author's surname, {title} and
+    {Title}, the first title word that isn't banned, and {date} or {year}.
+    """
+
+    def __init__(self, context):
+        self.key_format = context["key_format"]
+        self.clean = re.compile(context["key_clean_regex"])
+        self.banned = re.compile(context["key_title_banned_regex"])
+        self._next = {}
+
+    def render(self, item):
+        """
+        Returns: The key of an item before collisions are resolved, or ""
+        if the format renders to nothing for it.
+        """
+        author = strip_accents(FIRST_AUTHOR.split(item.author)[0])
+        author = self.clean.sub("", author)
+        title = self.banned.sub("", strip_accents(item.title).lower() + " ")
+        title = next(
+            (word for word in (self.clean.sub("", w) for w in title.split()) if word),
+            "",
+        )
+        return self.key_format.format(
+            author=author.lower(),
+            Author=author[:1].upper() + author[1:],
+            title=title,
+            Title=title.capitalize(),
+            date=item.date,
+            year=item.date,
+        )
+
+    def unique(self, key, taken):
+        """
+        Returns: key, or key with the first suffix of a, b, ... z, aa, ab...
+        that isn't taken. The result is added to taken.
+        """
+        candidate = key
+        number = self._next.get(key, 0)
+        while candidate in taken:
+            candidate = key + suffix(number)
+            number += 1
+        self._next[key] = number
+        taken.add(candidate)
+        return candidate
+
+
+def suffix(number):
+    """
+    Returns: The letters for a 0-based number, a to z and then aa onwards.
+    """
+    letters = ""
+    number += 1
+    while number:
+        number, remainder = divmod(number - 1, 26)
+        letters = string.ascii_lowercase[remainder] + letters
+    return letters
+
+
+def generate_keys(context, items, pending, fallback):
+    """
+    Sets a key from key_format on the items at the indexes in pending, in
+    order, unique among the keys of all items. Items the format renders
+    nothing for, or all of them if there is no format, get fallback(item).
+    """
+    generator = KeyGenerator(context) if context.get("key_format") else None
+    pending = set(pending)
+    taken = set(item.key for index, item in enumerate(items) if index not in pending)
+    for index in sorted(pending):
+        item = items[index]
+        key = generator.render(item) if generator else ""
+        if key:
+            item.key = generator.unique(key, taken)
+        else:
+            item.key = fallback(item)
+            taken.add(item.key)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import re
+import sys
+from array import array
+
+# Item labels indexed for filtered views, and the cache sections they use.
+KINDS = ("tags", "collections")
+
+SEPARATOR = re.compile(r"\s*[,;]\s*")
+
+
+def split_labels(value):
+    """
+    Returns: The interned labels of a comma or semicolon separated field.
+    """
+    return [sys.intern(label) for label in SEPARATOR.split(value.strip()) if label]
+
+
+def item_labels(item, kind):
+    if kind == "tags":
+        return split_labels(item.tags)
+    return item.collections
+
+
+def build_labels(items, kind):
+    """
+    Returns: A LabelTable of the tags or collections of the items.
+    """
+    ids = {}
+    for index, item in enumerate(items):
+        for label in set(item_labels(item, kind)):
+            ids.setdefault(label, array("I")).append(index)
+    names = sorted(ids)
+    offsets = array("I")
+    postings = array("I")
+    for name in names:
+        offsets.append(len(postings))
+        offsets.append(len(ids[name]))
+        postings.extend(ids[name])
+    return LabelTable(names, offsets, postings)
+
+
+class LabelTable(object):
+    """
+    Inverted index of one kind of label to the items of a bibtex file
+    that have it.
+    """
+
+    def __init__(self, names, offsets, postings):
+        self.names = names
+        self._offsets = offsets
+        self._postings = postings
+        self._numbers = None
+
+    def _number(self, name):
+        if self._numbers is None:
+            self._numbers = dict((n, i) for i, n in enumerate(self.names))
+        return self._numbers.get(name)
+
+    def count(self, name):
+        number = self._number(name)
+        return 0 if number is None else self._offsets[number * 2 + 1]
+
+    def ids(self, name):
+        """
+        Returns: The indexes of the items labelled name, in file order.
+        """
+        number = self._number(name)
+        if number is None:
+            return []
+        offset = self._offsets[number * 2]
+        return self._postings[offset : offset + self._offsets[number * 2 + 1]]
@@ -0,0 +1,552 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from citation_vim import stats
+from citation_vim.check import KeyIndex
+from citation_vim.cache import CacheLock, CacheReader, content_digest, fingerprint
+from citation_vim.cache import get_cache_file, read_cache, source_stamp, version_stamps
+from citation_vim.cache import write_cache
+from citation_vim.duplicates import fingerprint as duplicate_fingerprint
+from citation_vim.duplicates import find_duplicates
+from citation_vim.labels import KINDS as LABEL_KINDS
+from citation_vim.labels import build_labels
+from citation_vim.search import SearchIndex
+from citation_vim.sorting import build_sort_keys
+
+# Libraries kept resident in the plugin host, by cache path and settings.
+_libraries = {}
+_libraries_lock = threading.Lock()
+
+# Memoized candidate lists kept per library, the least recently used is
+# dropped first.
+MEMO_SIZE = 4
+
+
+def get_library(context):
+    """
+    Returns: The resident Library for the context, creating it on first use.
+    """
+    key = _library_key(context)
+    with _libraries_lock:
+        library = _libraries.get(key)
+        if library is None:
+            library = _libraries[key] = Library(context)
+        return library
+
+
+def is_resident(context):
+    """
+    Returns: Whether the Library for the context was already created.
+    """
+    with _libraries_lock:
+        return _library_key(context) in _libraries
+
+
+def _library_key(context):
+    return (
+        context["cache_path"],
+        tuple(fingerprint(file_context(context, f)) for f in context["bibtex_files"]),
+    )
+
+
+def get_vim_context(vim):
+    """
+    Returns: The library settings from the g:citation_vim_* variables.
+    """
+    from citation_vim.context_loader import DEFAULTS, ContextLoader
+
+    context = dict(DEFAULTS)
+    context.update(ContextLoader(vim).context)
+    return context
+
+
+def get_vim_library(vim):
+    """
+    Returns: The resident Library for the g:citation_vim_* settings, for
+    commands used outside of Denite.
+    """
+    return get_library(get_vim_context(vim))
+
+
+def reload():
+    """
+    Forces every resident library to re-parse its bibtex files on next use.
+    """
+    with _libraries_lock:
+        for library in _libraries.values():
+            library.invalidate()
+
+
+def file_context(context, bibtex_file):
+    """
+    Returns: A copy of the context for one of its bibtex files.
+    """
+    context = dict(context)
+    context["bibtex_file"] = bibtex_file
+    return context
+
+
+def update_cache(context, force=False):
+    """
+    Returns: The library of context["bibtex_file"], from its cache if that is
+    current, otherwise parsing the changed entries and updating the cache.
+    In zotero mode the file is the Zotero database.
+
+    Only one Vim instance rebuilds a cache at a time. While another one
+    holds the lock, the previous cache is returned marked "stale", or if
+    there is none the lock is waited for.
+    """
+    settings = fingerprint(context)
+    path = get_cache_file(context)
+    library = None if force else read_cache(path, settings)
+    with stats.timer("is_fresh"):
+        fresh = is_fresh(library, context["bibtex_file"])
+    if fresh:
+        return library
+    lock = CacheLock(path)
+    if not lock.acquire(blocking=library is None):
+        stats.count("cache_locked")
+        library["stale"] = True
+        return library
+    try:
+        if not force:
+            # Another instance may have rebuilt it while the lock was waited for
+            library = read_cache(path, settings) or library
+            if is_fresh(library, context["bibtex_file"]):
+                return library
+        source = source_stamp(context["bibtex_file"])
+        if context.get("mode") == "zotero":
+            # Zotero touches its database all the time and the changed rows
+            # are read anyway, hashing all of it would only slow opens down
+            source += (bytes(16),)
+        else:
+            source += (content_digest(context["bibtex_file"]),)
+        if library is None or library["source"] is None or not any(source[2]):
+            unchanged = False
+        else:
+            unchanged = library["source"][2] == source[2]
+        if unchanged:
+            # Touched but not modified, only the stamp needs rewriting
+            stats.count("cache_touched")
+        elif context.get("mode") == "zotero":
+            from citation_vim.zotero.parser import ZoteroParser
+
+            library = ZoteroParser(context).update(library)
+        else:
+            from citation_vim.bibtex.parser import BibtexParser
+
+            library = BibtexParser(context).update(library)
+        library["source"] = source
+        write_cache(path, library, settings)
+        # Map what was written, for the search index and lazily read fields
+        return read_cache(path, settings) or library
+    finally:
+        lock.release()
+
+
+def is_fresh(library, bibtex_file):
+    """
+    Returns: Whether the bibtex file has the size and mtime the library was
+    built at. Otherwise update_cache compares the content digest.
+    """
+    if library is None or library["source"] is None:
+        return False
+    return source_stamp(bibtex_file) == tuple(library["source"][:2])
+
+
+def _update_cache_file(context, force):
+    # Runs in a worker process, the parent maps the cache it writes
+    update_cache(context, force)
+
+
+class BibFile(object):
+    """
+    Items of one bibtex file and the stat they were loaded at.
+    """
+
+    def __init__(self, context):
+        self.context = context
+        self.path = context["bibtex_file"]
+        self.stamp = None
+        self.items = None
+        self.index = None
+        self.fingerprints = None
+        self.labels = None
+        self.spans = None
+        self.macro_spans = None
+        self.sort_keys = None
+        self.force = False
+
+    def stat(self):
+        with stats.timer("stat"):
+            return source_stamp(self.path)
+
+    def is_loaded(self):
+        return self.items is not None and not self.force and self.stat() == self.stamp
+
+    def load(self, parsed=False, stamp=None):
+        """
+        Loads the items, from the freshly written cache if `parsed` by a
+        worker process. A stale snapshot, kept while another Vim instance
+        rebuilds the cache, is loaded without its stamp so it is retried.
+        """
+        stamp = stamp or self.stat()
+        library = update_cache(self.context, self.force and not parsed)
+        self.items = library["items"]
+        self.index = library.get("index")
+        self.fingerprints = library.get("fingerprints")
+        self.spans = library.get("spans")
+        self.macro_spans = library.get("macro_spans")
+        self.labels = library.get("labels") or dict(
+            (kind, build_labels(self.items, kind)) for kind in LABEL_KINDS
+        )
+        self.sort_keys = library.get("sort_keys") or build_sort_keys(
+            self.items, version_stamps(library.get("versions"))
+        )
+        self.stamp = None if library.get("stale") else stamp
+        self.force = False
+
+
+class Library(object):
+    """
+    Parsed items of the bibtex files, kept between Denite invocations and
+    revalidated with a stat of each file.
+    """
+
+    def __init__(self, context):
+        self.context = dict(context)
+        self.files = [
+            BibFile(file_context(context, path)) for path in context["bibtex_files"]
+        ]
+        self.duplicates = {}
+        self._stamp = None
+        self._items = None
+        self._index = None
+        self._keys = None
+        self._orders = {}
+        self._memo = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get_items(self):
+        """
+        Returns: Items of all files in order, re-read only for files that
+        have changed.
+        """
+        with self._lock:
+            stamp = self._stat()
+            if self._items is None or stamp != self._stamp:
+                stats.count("library_miss")
+                with stats.timer("load_library"):
+                    self._load()
+                self._stamp = tuple(bib_file.stamp for bib_file in self.files)
+            else:
+                stats.count("library_hit")
+            return self._items
+
+    def memo(self, key, build):
+        """
+        Returns: build() for the current items, computed once per key until
+        the library is reloaded.
+        """
+        with self._lock:
+            items = self.get_items()
+            value = self._memo.get(key)
+            if value is None:
+                value = build(items)
+            self._remember(key, value)
+            return value
+
+    def peek(self, key):
+        """
+        Returns: The memoized value for key if the items are current, without
+        waiting for a load in progress. None otherwise.
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            if self._items is None or self._stat() != self._stamp:
+                return None
+            value = self._memo.get(key)
+            if value is not None:
+                self._memo.move_to_end(key)
+            return value
+        finally:
+            self._lock.release()
+
+    def peek_index(self):
+        """
+        Returns: The SearchIndex of the current items, or None while they
+        load or when a file has no index.
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            if self._items is None or self._stat() != self._stamp:
+                return None
+            return self._index
+        finally:
+            self._lock.release()
+
+    def key_index(self):
+        """
+        Returns: The KeyIndex of the current items, built once per load.
+        """
+        with self._lock:
+            items = self.get_items()
+            if self._keys is None:
+                with stats.timer("key_index"):
+                    self._keys = KeyIndex(items)
+            return self._keys
+
+    def column(self, field):
+        """
+        Returns: The values of one field of every item, read in bulk from
+        the cache of each file.
+        """
+        with self._lock:
+            self.get_items()
+            values = []
+            for bib_file in self.files:
+                values.extend(_column(bib_file.items, field))
+            return values
+
+    def order(self, mode):
+        """
+        Returns: The indexes of the items in a sort mode's order, looked up
+        in the sort keys cached for each file and merged across files.
+        """
+        with self._lock:
+            self.get_items()
+            if len(self.files) == 1:
+                return self.files[0].sort_keys.order(mode)
+            order = self._orders.get(mode)
+            if order is None:
+                with stats.timer("merge_order"):
+                    order = self._orders[mode] = self._merge_order(mode)
+            return order
+
+    def _merge_order(self, mode):
+        if mode == "file":
+            return range(len(self._items))
+        orders = []
+        base = 0
+        for bib_file in self.files:
+            # Each file is already in order, ties stay in the order of files
+            orders.append(_keyed_order(bib_file.sort_keys, mode, base))
+            base += len(bib_file.sort_keys)
+        return [index for _, index in heapq.merge(*orders)]
+
+    def locate(self, index):
+        """
+        Returns: The BibFile of the item at index, and its index in the file.
+        """
+        with self._lock:
+            self.get_items()
+            for bib_file in self.files:
+                if index < len(bib_file.items):
+                    return bib_file, index
+                index -= len(bib_file.items)
+            raise IndexError("item index out of range")
+
+    def duplicate_groups(self):
+        """
+        Returns: Groups of duplicate entries across all files, found from the
+        fingerprints stored in their caches.
+        """
+        return self.memo(("duplicate_groups",), self._find_duplicate_groups)
+
+    def _find_duplicate_groups(self, items):
+        fingerprints = []
+        for bib_file in self.files:
+            if bib_file.fingerprints is None:
+                fingerprints.extend(
+                    duplicate_fingerprint(item) for item in bib_file.items
+                )
+            else:
+                fingerprints.extend(bib_file.fingerprints)
+        with stats.timer("find_duplicates"):
+            return find_duplicates(items, fingerprints)
+
+    def labelled(self, kind, name):
+        """
+        Returns: The indexes of the items with the tag or collection name, in
+        order, looked up in the label index of each file.
+        """
+        with self._lock:
+            self.get_items()
+            indexes = []
+            base = 0
+            for bib_file in self.files:
+                indexes.extend(base + i for i in bib_file.labels[kind].ids(name))
+                base += len(bib_file.items)
+            return indexes
+
+    def label_counts(self, kind):
+        """
+        Returns: A dict of each tag or collection to its number of items.
+        """
+        with self._lock:
+            self.get_items()
+            counts = {}
+            for bib_file in self.files:
+                table = bib_file.labels[kind]
+                for name in table.names:
+                    counts[name] = counts.get(name, 0) + table.count(name)
+            return counts
+
+    def stream(self, key, generate, batch_size):
+        """
+        Returns: A started CandidateStream building generate(items) in the
+        background, memoized under key once complete.
+        """
+        stream = CandidateStream(self, key, generate, batch_size)
+        stream.start()
+        return stream
+
+    def _store(self, key, items, value):
+        with self._lock:
+            if items is self._items:
+                self._remember(key, value)
+
+    def _remember(self, key, value):
+        self._memo[key] = value
+        self._memo.move_to_end(key)
+        while len(self._memo) > MEMO_SIZE:
+            self._memo.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._stamp = None
+            for bib_file in self.files:
+                bib_file.force = True
+
+    def _stat(self):
+        return tuple(bib_file.stat() for bib_file in self.files)
+
+    def _load(self):
+        """
+        Loads changed files, in parallel worker processes when there are
+        several, and merges their items.
+        """
+        stale = [bib_file for bib_file in self.files if not bib_file.is_loaded()]
+        workers = self.context["parse_workers"] or os.cpu_count() or 1
+        if len(stale) > 1 and workers > 1:
+            # Imported here, a warm open never needs a process pool
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            stamps = [bib_file.stat() for bib_file in stale]
+            spawn = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(min(workers, len(stale)), spawn) as pool:
+                list(
+                    pool.map(
+                        _update_cache_file,
+                        [bib_file.context for bib_file in stale],
+                        [bib_file.force for bib_file in stale],
+                    )
+                )
+            for bib_file, stamp in zip(stale, stamps):
+                bib_file.load(parsed=True, stamp=stamp)
+        else:
+            for bib_file in stale:
+                bib_file.load()
+
+        items = []
+        parts = []
+        sources = {}
+        for bib_file in self.files:
+            if len(self.files) > 1:
+                # Keys shared by entries of the same file aren't reported here
+                for key in set(_column(bib_file.items, "key")):
+                    sources.setdefault(key, []).append(bib_file.path)
+            parts.append((bib_file.index, len(items)))
+            items.extend(bib_file.items)
+        self.duplicates = dict(
+            (key, paths) for key, paths in sources.items() if len(paths) > 1
+        )
+        self._items = items
+        self._index = None
+        if all(index is not None for index, _ in parts):
+            self._index = SearchIndex(items, parts)
+        self._keys = None
+        self._orders = {}
+        self._memo = OrderedDict()
+
+
+def _column(items, field):
+    if isinstance(items, CacheReader):
+        return items.column(field)
+    return [getattr(item, field) for item in items]
+
+
+def _keyed_order(sort_keys, mode, base):
+    for index in sort_keys.order(mode):
+        yield sort_keys.key(mode, index), base + index
+
+
+class CandidateStream(object):
+    """
+    Loads a library and builds its candidates on a background thread,
+    handing them out in batches as they are ready.
+    """
+
+    def __init__(self, library, key, generate, batch_size):
+        self._library = library
+        self._key = key
+        self._generate = generate
+        self._batch_size = max(1, batch_size)
+        self._queue = queue.Queue()
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def take(self):
+        """
+        Returns: (candidates ready since the last call, whether the stream is
+        finished). Re-raises errors from the background thread.
+        """
+        candidates = []
+        while True:
+            try:
+                batch = self._queue.get_nowait()
+            except queue.Empty:
+                return candidates, False
+            if batch is None:
+                return candidates, True
+            if isinstance(batch, Exception):
+                raise batch
+            candidates.extend(batch)
+
+    def _run(self):
+        try:
+            items = self._library.get_items()
+            candidates = []
+            batch = []
+            start = time.monotonic()
+            for candidate in self._generate(items):
+                batch.append(candidate)
+                if len(batch) >= self._batch_size:
+                    if self._cancelled.is_set():
+                        return
+                    self._queue.put(batch)
+                    candidates.extend(batch)
+                    batch = []
+            self._queue.put(batch)
+            candidates.extend(batch)
+            stats.record("candidates", time.monotonic() - start)
+            stats.count("candidates_built", len(candidates))
+            self._library._store(self._key, items, candidates)
+        except Exception as error:
+            self._queue.put(error)
+        finally:
+            self._queue.put(None)
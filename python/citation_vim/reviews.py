@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+import os
+from citation_vim import stats
+
+# Review indexes kept resident in the plugin host, by review directory.
+_indexes = {}
+
+
+def get_review_index(review_directory):
+    """
+    Returns: The ReviewIndex of the review directory, creating it on first use.
+    """
+    index = _indexes.get(review_directory)
+    if index is None:
+        index = _indexes[review_directory] = ReviewIndex(review_directory)
+    return index
+
+
+def literature_directory(review_directory):
+    """
+    Returns: The directory PDFs are kept in, beside the reviews.
+    """
+    return review_directory.replace("/reviews/", "/literature/")
+
+
+class DirectoryIndex(object):
+    """
+    Names of the files in a directory, listed with a single os.scandir and
+    only listed again when the directory's mtime changes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime = None
+        self.names = frozenset()
+
+    def refresh(self):
+        """
+        Returns: The mtime of the directory, or None if it doesn't exist.
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != self.mtime:
+            names = []
+            if mtime is not None:
+                with stats.timer("scandir"):
+                    with os.scandir(self.path) as entries:
+                        names = [entry.name for entry in entries if entry.is_file()]
+            self.names = frozenset(names)
+            self.mtime = mtime
+        return mtime
+
+
+class ReviewIndex(object):
+    """
+    Which entries have a review in the review directory, and a PDF in the
+    literature directory. Both are named after the nick or key of the entry.
+    """
+
+    def __init__(self, review_directory):
+        self.review_directory = review_directory
+        self.reviews = DirectoryIndex(review_directory)
+        self.literature = DirectoryIndex(literature_directory(review_directory))
+        self._annotated = (None, None)
+
+    def refresh(self):
+        """
+        Returns: A version that changes whenever either directory does.
+        """
+        return (self.reviews.refresh(), self.literature.refresh())
+
+    def has_review(self, name):
+        return name in self.reviews.names
+
+    def has_pdf(self, name):
+        return pdf_name(name) in self.literature.names
+
+    def pdf_path(self, name):
+        """
+        Returns: The path of the PDF for the review name, or None.
+        """
+        if not self.has_pdf(name):
+            return None
+        return self.literature.path + pdf_name(name)
+
+    def annotate(self, candidates):
+        """
+        Marks a shared list of candidates, unless it was already marked since
+        either directory last changed.
+        """
+        version = self.refresh()
+        annotated, annotated_version = self._annotated
+        if annotated is candidates and annotated_version == version:
+            return
+        self.mark(candidates)
+        self._annotated = (candidates, version)
+
+    def mark(self, candidates):
+        """
+        Sets whether the entry of each candidate has a review or a PDF, and
+        shows it at the start of the candidate.
+        """
+        self.refresh()
+        start = len(self.review_directory)
+        with stats.timer("annotate"):
+            for candidate in candidates:
+                name = candidate["action__path"][start:]
+                review = name in self.reviews.names
+                pdf = pdf_name(name) in self.literature.names
+                candidate["citation__review"] = review
+                candidate["citation__pdf"] = pdf
+                candidate["abbr"] = (
+                    ("R" if review else "-")
+                    + ("P" if pdf else "-")
+                    + " "
+                    + candidate["word"]
+                )
+
+
+def pdf_name(name):
+    return name[:-3] + ".pdf" if name.endswith(".md") else name + ".pdf"
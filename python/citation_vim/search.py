@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+import collections
+import re
+from array import array
+
+# Fields searched by matcher_citation and their weight when ranking matches.
+# The field number is kept in the low bits of each posting.
+SEARCH_FIELDS = (
+    ("key", 10),
+    ("author", 8),
+    ("nick", 6),
+    ("title", 5),
+    ("tags", 3),
+    ("date", 2),
+)
+FIELD_BITS = 3
+FIELD_MASK = (1 << FIELD_BITS) - 1
+
+# Score multipliers for a query word equal to, or a prefix of, a token.
+EXACT = 3
+PREFIX = 2
+
+# Query words shorter than this are matched against the candidate text.
+MIN_WORD = 2
+
+TOKEN = re.compile(r"\w+")
+
+
+def build_index(items):
+    """
+    Returns: (vocabulary, postings), the sorted tokens of the searched fields
+    and for each token an array of item index << FIELD_BITS | field number.
+    """
+    tokens = collections.defaultdict(list)
+    for index, item in enumerate(items):
+        for number, (field, _) in enumerate(SEARCH_FIELDS):
+            value = getattr(item, field, "")
+            if not value:
+                continue
+            code = index << FIELD_BITS | number
+            for token in set(TOKEN.findall(value.lower())):
+                tokens[token].append(code)
+    vocabulary = sorted(tokens)
+    return vocabulary, [array("I", tokens[token]) for token in vocabulary]
+
+
+class TokenIndex(object):
+    """
+    Inverted index of the tokens of one bibtex file. Query words are looked
+    up as substrings of the vocabulary, which is kept as a single string.
+    """
+
+    def __init__(self, vocabulary, offsets, postings):
+        self._vocabulary = vocabulary
+        self._offsets = offsets
+        self._postings = postings
+        self._starts = None
+
+    def find(self, word):
+        """
+        Returns: Pairs of (token number, score multiplier) for every token
+        containing word.
+        """
+        if self._starts is None:
+            starts = array("I", [0])
+            starts.extend(m.end() for m in re.finditer("\n", self._vocabulary))
+            self._starts = starts
+        vocabulary = self._vocabulary
+        found = []
+        position = vocabulary.find(word)
+        while position != -1:
+            number = bisect.bisect_right(self._starts, position) - 1
+            start = self._starts[number]
+            end = vocabulary.find("\n", position)
+            end = len(vocabulary) if end == -1 else end
+            if position != start:
+                multiplier = 1
+            elif end - start == len(word):
+                multiplier = EXACT
+            else:
+                multiplier = PREFIX
+            found.append((number, multiplier))
+            position = vocabulary.find(word, end)
+        return found
+
+    def postings(self, number):
+        offset = self._offsets[number * 2]
+        return self._postings[offset : offset + self._offsets[number * 2 + 1]]
+
+
+class SearchIndex(object):
+    """
+    Search over the items of a library, from the TokenIndex of each of its
+    files and the position of that file's first item.
+    """
+
+    def __init__(self, items, parts, memo_size=64):
+        self.items = items
+        self._parts = parts
+        self._memo = collections.OrderedDict()
+        self._memo_size = memo_size
+
+    def match(self, word):
+        """
+        Returns: A dict of item index to score for the items with word in
+        one of their searched fields, or None if word is too short to look
+        up or isn't a single token, such as "[@smith", and is matched
+        against the candidate text instead.
+        """
+        word = word.lower()
+        if len(word) < MIN_WORD or TOKEN.fullmatch(word) is None:
+            return None
+        scores = self._memo.get(word)
+        if scores is None:
+            scores = self._match_token(word)
+            self._memo[word] = scores
+            if len(self._memo) > self._memo_size:
+                self._memo.popitem(last=False)
+        else:
+            self._memo.move_to_end(word)
+        return scores
+
+    def _match_token(self, token):
+        weights = [weight for _, weight in SEARCH_FIELDS]
+        scores = {}
+        for part, base in self._parts:
+            for number, multiplier in part.find(token):
+                for code in part.postings(number):
+                    index = base + (code >> FIELD_BITS)
+                    score = weights[code & FIELD_MASK] * multiplier
+                    if score > scores.get(index, 0):
+                        scores[index] = score
+        return scores
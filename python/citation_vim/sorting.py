@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+from array import array
+from datetime import datetime, timezone
+from functools import partial
+from citation_vim.duplicates import FIRST_AUTHOR, NOT_WORD, YEAR
+from citation_vim.utils import strip_accents
+
+# Orders g:citation_vim_sort can list items in. "file" is the order of the
+# bibtex files, "modified" the order Zotero items were last edited in.
+MODES = ("file", "date", "author", "title", "modified")
+
+# Modes listed newest first, the others are alphabetical
+DESCENDING = frozenset(["date", "modified"])
+
+# Modes whose keys are numbers, the others are normalized text
+NUMERIC = frozenset(["date", "modified"])
+
+# Titles are only compared on their first characters
+TITLE_LENGTH = 48
+
+
+def normalize(text):
+    """
+    Returns: Text folded for sorting, without accents, case or punctuation.
+    """
+    if not text.isascii():
+        text = strip_accents(text)
+    return NOT_WORD.sub(" ", text.casefold()).strip()
+
+
+def modified_time(stamp):
+    """
+    Returns: The seconds since the epoch of a Zotero modification stamp,
+    "YYYY-MM-DD HH:MM:SS" in UTC, or 0.
+    """
+    try:
+        stamp = datetime.fromisoformat(stamp).replace(tzinfo=timezone.utc)
+    except ValueError:
+        return 0
+    return min(max(0, int(stamp.timestamp())), 0xFFFFFFFF)
+
+
+def build_sort_keys(items, stamps=None):
+    """
+    Returns: The SortKeys of the items, and of their Zotero modification
+    stamps if they have any.
+    """
+    years = array("I")
+    authors = []
+    titles = []
+    for item in items:
+        year = YEAR.search(item.date)
+        years.append(int(year.group()) if year else 0)
+        authors.append(normalize(FIRST_AUTHOR.split(item.author)[0]))
+        titles.append(normalize(item.title)[:TITLE_LENGTH])
+    modified = None
+    if stamps is not None:
+        modified = array("I", (modified_time(stamp) for stamp in stamps))
+    return SortKeys(len(years), years, modified, authors, titles)
+
+
+class SortKeys(object):
+    """
+    Sort keys of the items of a bibtex file, with the order of the items
+    in each mode. Columns read from the cache are only decoded when a key
+    is needed to merge the orders of several files.
+    """
+
+    def __init__(self, count, years, modified, authors, titles, orders=None):
+        self._count = count
+        self._columns = {
+            "date": years,
+            "modified": modified,
+            "author": authors,
+            "title": titles,
+        }
+        self._orders = orders or {}
+
+    def __len__(self):
+        return self._count
+
+    def column(self, mode):
+        """
+        Returns: The keys of the items for a mode, None if they have none.
+        """
+        column = self._columns[mode]
+        if isinstance(column, bytes):
+            column = column.decode("utf-8").split("\n")
+            self._columns[mode] = column
+        return column
+
+    def key(self, mode, index):
+        """
+        Returns: The key of the item at index, increasing in mode's order.
+        Items without a year, author or title sort last.
+        """
+        column = self.column(mode)
+        if column is None:
+            return 0
+        if mode in DESCENDING:
+            return -column[index]
+        return (not column[index], column[index])
+
+    def order(self, mode):
+        """
+        Returns: The indexes of the items in mode's order, ties in file
+        order.
+        """
+        if mode == "file" or self._columns[mode] is None:
+            return range(self._count)
+        order = self._orders.get(mode)
+        if order is None:
+            # sorted is stable, so equal keys stay in file order
+            order = sorted(range(self._count), key=partial(self.key, mode))
+            order = self._orders[mode] = array("I", order)
+        return order
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+# Phase timings and counters for :CitationStats, collected only when enabled.
+enabled = False
+log_file = None
+timings = {}
+counters = {}
+_current = {}
+
+
+class _Timer(object):
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, time.monotonic() - self.start)
+        return False
+
+
+class _NullTimer(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_null_timer = _NullTimer()
+
+
+def configure(enable, log=None):
+    """
+    Turns collection on or off, optionally appending JSON lines to log.
+    """
+    global enabled, log_file
+    enabled = bool(enable)
+    log_file = log if enabled else None
+
+
+def timer(name):
+    """
+    Returns: A context manager timing the phase name.
+    """
+    if enabled:
+        return _Timer(name)
+    return _null_timer
+
+
+def record(name, seconds):
+    if not enabled:
+        return
+    timing = timings.get(name)
+    if timing is None:
+        timing = timings[name] = [0, 0.0, 0.0]
+    timing[0] += 1
+    timing[1] += seconds
+    timing[2] = seconds
+    _current[name] = _current.get(name, 0.0) + seconds
+
+
+def count(name, amount=1):
+    if enabled:
+        counters[name] = counters.get(name, 0) + amount
+
+
+def flush(event):
+    """
+    Appends the phases timed since the last flush to the log as one JSON
+    line.
+    """
+    global _current
+    if not enabled:
+        return
+    if log_file and _current:
+        import json
+
+        line = {
+            "time": time.time(),
+            "event": event,
+            "phases": _current,
+            "counters": counters,
+        }
+        with open(log_file, "a") as out_file:
+            out_file.write(json.dumps(line, sort_keys=True) + "\n")
+    _current = {}
+
+
+def reset():
+    global _current
+    timings.clear()
+    counters.clear()
+    _current = {}
+
+
+def report():
+    """
+    Returns: Phase timings and counters as a printable table.
+    """
+    if not enabled and not timings:
+        return "Citation.vim stats are disabled, set g:citation_vim_stats = 1"
+    lines = ["%-24s %8s %12s %12s %12s" % ("phase", "calls", "total", "mean", "last")]
+    for name, (calls, total, last) in sorted(timings.items()):
+        lines.append(
+            "%-24s %8d %10.2fms %10.2fms %10.2fms"
+            % (name, calls, total * 1000, total * 1000 / calls, last * 1000)
+        )
+    for name, value in sorted(counters.items()):
+        lines.append("%-24s %8d" % (name, value))
+    return "\n".join(lines)
@@ -3,8 +3,7 @@
 import sys
 import re
 import os.path
-from datetime import datetime
-import pickle
+import unicodedata
 
 
 def decode_str(string):
@@ -14,17 +13,6 @@ def decode_str(string):
         return string
 
 
-def is_current(file_path, cache_path):
-    if not os.path.isfile(file_path):
-        raiseError("{} does not exist".format(file_path))
-    if not os.path.isfile(cache_path):
-        return False
-
-    filetime = datetime.fromtimestamp(os.path.getctime(file_path))
-    cachetime = datetime.fromtimestamp(os.path.getctime(cache_path))
-    return filetime < cachetime
-
-
 def check_path(path):
     path = os.path.abspath(os.path.expanduser(path))
     return os.path.exists(path)
@@ -34,21 +22,35 @@ def raiseError(message):
     raise RuntimeError("Citation.vim error: " + message)
 
 
+BRACES = re.compile("[{.*}]+")
+
+
 def strip_braces(string):
-    return re.sub("[{.*}]+", "", string)
+    return BRACES.sub("", string)
 
 
-def read_cache(cache_file):
+def strip_accents(string):
     """
-    Returns items from the cache file.
+    Returns: The string without its accents, e.g. "Gödel" as "Godel".
     """
-    with open(cache_file, "rb") as in_file:
-        return pickle.load(in_file)
+    string = unicodedata.normalize("NFKD", string)
+    return "".join(char for char in string if not unicodedata.combining(char))
 
 
-def write_cache(cache_file, items):
+def format_author(authors, et_al_limit):
     """
-    Writes the cache file.
+    Returns: Authors - format depending on et_al_limit. Each author is an
+    array of name parts, surname first.
     """
-    with open(cache_file, "wb") as out_file:
-        pickle.dump(items, out_file)
+    if authors == []:
+        return ""
+    if len(authors) > et_al_limit:
+        return "%s et al." % authors[0][0]
+    if len(authors) > 2:
+        auth_string = ""
+        for author in authors[:-1]:
+            auth_string += author[0] + ", "
+        return auth_string + "& " + authors[-1][0]
+    if len(authors) == 2:
+        return authors[0][0] + " & " + authors[1][0]
+    return ", ".join(authors[0])
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+import os.path
+import threading
+import time
+from citation_vim import stats
+from citation_vim.library import get_library, get_vim_context, is_resident
+
+# Seconds to wait after a request before warming up, unless set with
+# g:citation_vim_warmup_delay in milliseconds.
+DELAY = 1.0
+
+_warmer = None
+_warmer_lock = threading.Lock()
+
+
+def warm_up(vim):
+    """
+    Loads the library of the g:citation_vim_* settings in the background,
+    so the picker opens against it.
+    """
+    context = get_vim_context(vim)
+    get_warmer().schedule(context, _delay(context), _reporter(vim))
+
+
+def refresh_file(vim, path):
+    """
+    Returns: Whether a refresh was scheduled for a bibtex file that was
+    written, which is only done when the library it belongs to is resident.
+    """
+    context = get_vim_context(vim)
+    if context["mode"] != "bibtex" or not is_resident(context):
+        return False
+    path = os.path.realpath(path)
+    if not any(os.path.realpath(f) == path for f in context["bibtex_files"]):
+        return False
+    get_warmer().schedule(context, _delay(context), _reporter(vim))
+    return True
+
+
+def get_warmer():
+    global _warmer
+    with _warmer_lock:
+        if _warmer is None:
+            _warmer = Warmer()
+        return _warmer
+
+
+def _reporter(vim):
+    """
+    Returns: A function showing a warm-up error in Vim, from the thread the
+    warm-up runs on.
+    """
+
+    def report(error):
+        message = str(error)
+        if not isinstance(error, RuntimeError):
+            # Errors of raiseError already name the plugin
+            message = "Citation.vim warm-up failed: {!r}".format(error)
+        vim.async_call(vim.err_write, message + "\n")
+
+    return report
+
+
+def _delay(context):
+    if "warmup_delay" in context:
+        return context["warmup_delay"] / 1000.0
+    return DELAY
+
+
+class Warmer(object):
+    """
+    Refreshes caches and resident libraries on a background thread. Each
+    request postpones the warm-up until none came for its delay, so a burst
+    of saves only rebuilds once.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._pending = None
+        self._due = 0.0
+        self._thread = None
+
+    def schedule(self, context, delay=DELAY, report=None):
+        """
+        Warms up the library of the context once no request came for delay
+        seconds. An error is passed to report, if given.
+        """
+        with self._condition:
+            self._pending = (context, report)
+            self._due = time.monotonic() + delay
+            stats.count("warmup_requested")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def wait(self, timeout=None):
+        """
+        Returns: Whether the pending warm-ups finished within timeout.
+        """
+        with self._condition:
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
+
+    def _run(self):
+        while True:
+            with self._condition:
+                # A request made while waiting moves the warm-up later
+                while time.monotonic() < self._due:
+                    self._condition.wait(self._due - time.monotonic())
+                pending = self._pending
+                self._pending = None
+                if pending is None:
+                    self._thread = None
+                    return
+            self._warm(*pending)
+
+    def _warm(self, context, report):
+        try:
+            with stats.timer("warmup"):
+                library = get_library(context)
+                library.get_items()
+                library.order(context.get("sort", "file"))
+                library.key_index()
+            stats.count("warmup")
+        except Exception as error:
+            stats.count("warmup_failed")
+            if report is not None:
+                report(error)
@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+
+import html
+import os.path
+import re
+import sqlite3
+from urllib.request import pathname2url
+from citation_vim import stats
+from citation_vim.cache import LIST_SEPARATOR, source_stamp
+from citation_vim.item import Item
+from citation_vim.keys import generate_keys
+from citation_vim.utils import check_path, format_author, raiseError
+
+# Item fields and the Zotero fields they are read from, in order of preference.
+FIELDS = {
+    "title": ("title",),
+    "date": ("date",),
+    "publication": (
+        "publicationTitle",
+        "bookTitle",
+        "proceedingsTitle",
+        "websiteTitle",
+    ),
+    "issue": ("issue",),
+    "volume": ("volume",),
+    "pages": ("pages",),
+    "publisher": ("publisher", "university", "institution"),
+    "language": ("language",),
+    "abstract": ("abstractNote",),
+    "url": ("url",),
+    "doi": ("DOI",),
+    "isbn": ("ISBN",),
+}
+
+# Better BibTeX keeps pinned citation keys in the extra field.
+CITATION_KEY = re.compile(r"^\s*(?:citation key|bibtex):\s*(\S+)\s*$", re.I | re.M)
+YEAR = re.compile(r"\d{4}")
+TAG = re.compile(r"<[^>]*>")
+
+# Attachment link modes
+IMPORTED_FILE, IMPORTED_URL, LINKED_FILE = 0, 1, 2
+
+# Bound parameters per query, below SQLite's default limit.
+CHUNK_SIZE = 500
+
+# Times the database is read again when it changes while it's being read.
+SNAPSHOT_ATTEMPTS = 3
+
+# Items that are references in their own right, in the order they were added
+LIST_ITEMS = """
+    SELECT items.itemID, items.key, typeName, clientDateModified, dateModified
+    FROM items JOIN itemTypes USING (itemTypeID)
+    WHERE typeName NOT IN ('attachment', 'note', 'annotation')
+    AND itemID NOT IN (SELECT itemID FROM deletedItems)
+    ORDER BY dateAdded, itemID
+"""
+LIST_CHILDREN = """
+    SELECT parentItemID, max(clientDateModified)
+    FROM (
+        SELECT itemID, parentItemID FROM itemAttachments
+        UNION ALL SELECT itemID, parentItemID FROM itemNotes
+    ) JOIN items USING (itemID)
+    WHERE parentItemID IS NOT NULL
+    GROUP BY parentItemID
+"""
+LIST_COLLECTIONS = """
+    SELECT itemID, collectionName
+    FROM collectionItems JOIN collections USING (collectionID)
+    ORDER BY itemID, collectionName
+"""
+SELECT_FIELDS = """
+    SELECT itemID, fieldName, value
+    FROM itemData JOIN fields USING (fieldID) JOIN itemDataValues USING (valueID)
+    WHERE {where}
+"""
+SELECT_CREATORS = """
+    SELECT itemID, creatorType, lastName, firstName, fieldMode
+    FROM itemCreators JOIN creators USING (creatorID)
+    JOIN creatorTypes USING (creatorTypeID)
+    WHERE {where}
+    ORDER BY itemID, orderIndex
+"""
+SELECT_TAGS = """
+    SELECT itemID, name FROM itemTags JOIN tags USING (tagID)
+    WHERE {where}
+    ORDER BY itemID, name
+"""
+SELECT_ATTACHMENTS = """
+    SELECT parentItemID, items.key, linkMode, contentType, path
+    FROM itemAttachments JOIN items USING (itemID)
+    WHERE {where} AND itemID NOT IN (SELECT itemID FROM deletedItems)
+    ORDER BY parentItemID, dateAdded
+"""
+SELECT_NOTES = """
+    SELECT parentItemID, note FROM itemNotes JOIN items USING (itemID)
+    WHERE {where} AND itemID NOT IN (SELECT itemID FROM deletedItems)
+    ORDER BY parentItemID, dateAdded
+"""
+
+
+def connect(database):
+    """
+    Returns: A read-only connection to a Zotero database. It is opened as
+    immutable, so it can be read while Zotero holds its exclusive lock.
+    """
+    uri = "file:%s?mode=ro&immutable=1" % pathname2url(os.path.abspath(database))
+    return sqlite3.connect(uri, uri=True)
+
+
+class ZoteroParser(object):
+    def __init__(self, context):
+        self.context = context
+        self.database = context["bibtex_file"]
+        self.storage = os.path.join(os.path.dirname(self.database), "storage")
+        if not check_path(self.database):
+            raiseError("{} does not exist".format(self.database))
+
+    def update(self, library=None):
+        """
+        Returns: A library dict for the Zotero database. Items whose modified
+        dates, children and collections are unchanged since `library` was
+        built are reused, only added and modified items are read.
+
+        Zotero may write to the database while it is read, the read is
+        retried until the database is unchanged across one.
+        """
+        for _ in range(SNAPSHOT_ATTEMPTS):
+            stamp = source_stamp(self.database)
+            try:
+                connection = connect(self.database)
+                try:
+                    result = self._update(connection, library)
+                finally:
+                    connection.close()
+            except sqlite3.DatabaseError:
+                result = None
+            if result is not None and source_stamp(self.database) == stamp:
+                return result
+        raiseError("{} could not be read".format(self.database))
+
+    def _update(self, connection, library):
+        with stats.timer("list_items"):
+            rows = connection.execute(LIST_ITEMS).fetchall()
+            children = dict(connection.execute(LIST_CHILDREN))
+            collections = {}
+            for item_id, name in connection.execute(LIST_COLLECTIONS):
+                collections.setdefault(item_id, []).append(name)
+
+        versions = []
+        for item_id, _, _, client_modified, modified in rows:
+            versions.append(
+                LIST_SEPARATOR.join(
+                    [client_modified or "", modified or "", children.get(item_id, "")]
+                    + collections.get(item_id, [])
+                )
+            )
+
+        reusable = {}
+        if library is not None and library.get("versions") is not None:
+            for version, item in zip(library["versions"], library["items"]):
+                reusable[(item.zotero_key, version)] = item
+        changed = [
+            row[0]
+            for row, version in zip(rows, versions)
+            if (row[1], version) not in reusable
+        ]
+        # Read every item in one pass when most of them changed
+        ids = None if len(changed) > len(rows) // 2 else changed
+        with stats.timer("build_items"):
+            parsed = self.build_items(connection, rows, ids, collections)
+        stats.count("entries_parsed", len(parsed))
+        stats.count("entries_reused", len(rows) - len(changed))
+
+        items = []
+        for row, version in zip(rows, versions):
+            item = reusable.get((row[1], version)) or parsed[row[0]]
+            items.append(item)
+        # Reused items keep their keys, so generated keys don't change
+        pending = [index for index, item in enumerate(items) if not item.key]
+        with stats.timer("generate_keys"):
+            generate_keys(self.context, items, pending, lambda item: item.zotero_key)
+        return {
+            "items": items,
+            "spans": None,
+            "macros": None,
+            "versions": versions,
+        }
+
+    def build_items(self, connection, rows, ids, collections):
+        """
+        Returns: A dict of itemID to Item, for the items of `rows` in ids, or
+        all of them if ids is None.
+        """
+        wanted = None if ids is None else set(ids)
+        fields = {}
+        for item_id, name, value in self._select(connection, SELECT_FIELDS, ids):
+            fields.setdefault(item_id, {})[name] = value
+        creators = {}
+        for row in self._select(connection, SELECT_CREATORS, ids):
+            creators.setdefault(row[0], []).append(row[1:])
+        tags = {}
+        for item_id, name in self._select(connection, SELECT_TAGS, ids):
+            tags.setdefault(item_id, []).append(name)
+        attachments = {}
+        for row in self._select(connection, SELECT_ATTACHMENTS, ids, "parentItemID"):
+            attachments.setdefault(row[0], []).append(row[1:])
+        notes = {}
+        for row in self._select(connection, SELECT_NOTES, ids, "parentItemID"):
+            notes.setdefault(row[0], []).append(row[1])
+
+        items = {}
+        for item_id, zotero_key, type_name, _, _ in rows:
+            if wanted is not None and item_id not in wanted:
+                continue
+            item_fields = fields.get(item_id, {})
+            item = Item()
+            for field, names in FIELDS.items():
+                setattr(item, field, self.get_field_from(item_fields, names))
+            item.date = self.format_date(item.date)
+            item.type = type_name
+            item.zotero_key = zotero_key
+            item.key = self.format_key(item_fields)
+            item.nick = ""
+            item.author = self.format_author(creators.get(item_id, []))
+            item.tags = ", ".join(tags.get(item_id, []))
+            item.collections = collections.get(item_id, [])
+            item.notes = self.format_notes(notes.get(item_id, []))
+            item.file = self.format_file(attachments.get(item_id, []))
+            if not item.url:
+                item.url = self.format_url(attachments.get(item_id, []))
+            items[item_id] = item
+        return items
+
+    def _select(self, connection, query, ids, column="itemID"):
+        """
+        Returns: The rows of a query for the items in ids, or for all items
+        if ids is None, in chunks that stay below SQLite's parameter limit.
+        """
+        if ids is None:
+            yield from connection.execute(query.format(where="1"))
+            return
+        for start in range(0, len(ids), CHUNK_SIZE):
+            chunk = ids[start : start + CHUNK_SIZE]
+            where = "%s IN (%s)" % (column, ", ".join("?" * len(chunk)))
+            yield from connection.execute(query.format(where=where), chunk)
+
+    def get_field_from(self, item_fields, names):
+        for name in names:
+            if name in item_fields:
+                return str(item_fields[name])
+        return ""
+
+    def format_key(self, item_fields):
+        """
+        Returns: The citation key of the item, or "" if it has none and one
+        is generated.
+        """
+        if item_fields.get("citationKey"):
+            return item_fields["citationKey"]
+        match = CITATION_KEY.search(item_fields.get("extra", ""))
+        if match:
+            return match.group(1)
+        return ""
+
+    def format_author(self, creators):
+        """
+        Returns: Authors - the item's authors, or all of its creators if it
+        has no authors.
+        """
+        authors = [row for row in creators if row[0] == "author"] or creators
+        names = []
+        for _, last_name, first_name, field_mode in authors:
+            if field_mode == 1 or not first_name:
+                names.append([last_name])
+            else:
+                names.append([last_name, first_name])
+        return format_author(names, self.context["et_al_limit"])
+
+    def format_date(self, date):
+        """
+        Returns: The year of a Zotero date, stored as "YYYY-MM-DD original".
+        """
+        year = YEAR.search(date)
+        return year.group() if year and year.group() != "0000" else ""
+
+    def format_notes(self, notes):
+        return "\n\n".join(html.unescape(TAG.sub("", note)).strip() for note in notes)
+
+    def format_file(self, attachments):
+        """
+        Returns: Path of the first PDF attachment
+        """
+        for key, link_mode, content_type, path in attachments:
+            if content_type == "application/pdf" and path:
+                return self.attachment_path(key, link_mode, path)
+        return ""
+
+    def format_url(self, attachments):
+        """
+        Returns: Path of the first attachment that isn't a PDF
+        """
+        for key, link_mode, content_type, path in attachments:
+            if content_type != "application/pdf" and path:
+                return self.attachment_path(key, link_mode, path)
+        return ""
+
+    def attachment_path(self, key, link_mode, path):
+        """
+        Returns: The absolute path of an attachment. Stored files are kept
+        under storage/ in a directory named after the attachment's key, and
+        linked files may be relative to the base attachment directory.
+        """
+        if link_mode in (IMPORTED_FILE, IMPORTED_URL) and path.startswith("storage:"):
+            return os.path.join(self.storage, key, path[len("storage:") :])
+        if link_mode == LINKED_FILE and path.startswith("attachments:"):
+            base = self.context.get("zotero_attachment_path", "")
+            return os.path.join(base, path[len("attachments:") :])
+        return path
@@ -0,0 +1,43 @@
+import sys
+from os.path import abspath, join, pardir
+
+import pynvim
+
+sys.path.append(abspath(join(__file__, pardir, pardir, pardir, "python")))
+from citation_vim import check, export, library, stats, warmup
+
+
+@pynvim.plugin
+class CitationCommands(object):
+    """
+    Commands that act on the resident libraries. They run in the remote
+    plugin host, where Denite keeps them, rather than in the :py3 interpreter.
+    Warm-ups return at once and load the library on a background thread.
+    """
+
+    def __init__(self, vim):
+        self.vim = vim
+
+    @pynvim.function("_citation_reload", sync=True)
+    def reload(self, args):
+        library.reload()
+
+    @pynvim.function("_citation_stats", sync=True)
+    def report_stats(self, args):
+        return stats.report()
+
+    @pynvim.function("_citation_check_buffer", sync=True)
+    def check_buffer(self, args):
+        return check.check_buffer(self.vim, self.vim.current.buffer[:])
+
+    @pynvim.function("_citation_export_bib", sync=True)
+    def export_bib(self, args):
+        return export.export_buffer(self.vim, self.vim.current.buffer[:], args[0])
+
+    @pynvim.function("_citation_warmup")
+    def warm_up(self, args):
+        warmup.warm_up(self.vim)
+
+    @pynvim.function("_citation_refresh_file")
+    def refresh_file(self, args):
+        warmup.refresh_file(self.vim, args[0])
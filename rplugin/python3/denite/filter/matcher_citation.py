@@ -0,0 +1,31 @@
+from denite.base.filter import Base
+
+
+class Filter(Base):
+    """
+    Matches citations through the search index of the library, falling back
+    to a substring match while the library loads and for words with other
+    characters than letters and digits, such as the "[@" of keys.
+    """
+
+    def __init__(self, vim):
+        super().__init__(vim)
+
+        self.name = "matcher_citation"
+        self.description = "citation index matcher"
+
+    def filter(self, context):
+        candidates = context["candidates"]
+        words = context["input"].lower().split()
+        if not words or not candidates:
+            return candidates
+        index = None
+        if "__library" in context and "citation__index" in candidates[0]:
+            index = context["__library"].peek_index()
+        for word in words:
+            scores = index.match(word) if index is not None else None
+            if scores is None:
+                candidates = [c for c in candidates if word in c["word"].lower()]
+            else:
+                candidates = [c for c in candidates if c["citation__index"] in scores]
+        return candidates
@@ -0,0 +1,41 @@
+import heapq
+from denite.base.filter import Base
+
+
+class Filter(Base):
+    """
+    Ranks citations by the field weighted score of each query word and keeps
+    the best g:citation_vim_match_limit of them.
+    """
+
+    def __init__(self, vim):
+        super().__init__(vim)
+
+        self.name = "sorter_citation"
+        self.description = "citation field weight sorter"
+
+    def filter(self, context):
+        candidates = context["candidates"]
+        words = context["input"].lower().split()
+        if not words or not candidates:
+            return candidates
+        index = None
+        if "__library" in context and "citation__index" in candidates[0]:
+            index = context["__library"].peek_index()
+        if index is None:
+            return candidates
+
+        totals = [0] * len(candidates)
+        for word in words:
+            scores = index.match(word)
+            for position, candidate in enumerate(candidates):
+                if scores is None:
+                    totals[position] += word in candidate["word"].lower()
+                else:
+                    totals[position] += scores.get(candidate["citation__index"], 0)
+        best = heapq.nlargest(
+            context.get("__match_limit") or len(candidates),
+            range(len(candidates)),
+            key=lambda position: (totals[position], -position),
+        )
+        return [candidates[position] for position in best]
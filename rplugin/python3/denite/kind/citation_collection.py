@@ -1,15 +1,37 @@
-import os
 import subprocess
+import sys
+from os.path import abspath, join, pardir
 from denite.kind.file import Kind as File
 from denite.kind.word import Kind as Word
 from denite.kind.openable import Kind as Openable
 
+sys.path.append(
+    abspath(join(__file__, pardir, pardir, pardir, pardir, pardir, "python"))
+)
+from citation_vim.reviews import get_review_index
+
 
 def eprint(*args, **kwargs):
     message = " ".join(map(str, args))
     raise Exception(message)
 
 
+def get_targets(context):
+    """
+    Returns: Copies of the targets, candidates are shared between Denite
+    invocations. Free text fields are read from the item here, rather than
+    kept in every candidate.
+    """
+    targets = []
+    for target in context["targets"]:
+        target = dict(target)
+        if "citation__item" in target:
+            item = target.pop("citation__item")
+            target["action__text"] = str(getattr(item, target["citation__field"]))
+        targets.append(target)
+    return targets
+
+
 class Kind(Word, File, Openable):
     def __init__(self, vim):
         super().__init__(vim)
@@ -19,8 +41,13 @@ class Kind(Word, File, Openable):
         self.vim = vim
 
     def action_append(self, context):
+        if "action__sources" in context["targets"][0]:
+            return self.action_narrow(context)
+        if "nick" not in context["targets"][0]:
+            # Candidates of a field sub-source append their text as it is
+            return Word.action_append(self, dict(context, targets=get_targets(context)))
         count = 0
-        targets = [target for target in context["targets"] if target["nick"]]
+        targets = [target for target in get_targets(context) if target["nick"]]
         for target in targets:
             count += 1
             if count == 1:
@@ -31,10 +58,25 @@ class Kind(Word, File, Openable):
                 target["action__text"] += ", "
             Word.action_append(self, {"targets": [target]})
 
+    def action_insert(self, context):
+        Word.action_insert(self, dict(context, targets=get_targets(context)))
+
+    def action_yank(self, context):
+        Word.action_yank(self, dict(context, targets=get_targets(context)))
+
+    def action_narrow(self, context):
+        # Opens the items of a tag or collection
+        context["sources_queue"].append(context["targets"][0]["action__sources"])
+
     def action_preview(self, context):
+        # Only the entries of the main list have reviews to create
         for target in context["targets"]:
+            if "review_directory" not in target:
+                continue
             path = target["action__path"].replace("-", "_")
-            if not os.path.exists(path):
+            reviews = get_review_index(target["review_directory"])
+            reviews.refresh()
+            if not reviews.has_review(path[len(reviews.review_directory) :]):
                 with open(target["review_directory"] + "review.template") as f:
                     template = f.read().replace("Paper", target["title"])
                 with open(path, "w") as f:
@@ -42,14 +84,18 @@ class Kind(Word, File, Openable):
         super().action_preview(context)
 
     def action_open(self, context):
+        if "review_directory" not in context["targets"][0]:
+            # Field sub-sources open their attachment or url
+            return File.action_open(self, context)
         for target in context["targets"]:
             path = target["action__path"].replace("-", "_")
-            path = path.replace(".md", ".pdf")
-            path = path.replace("/reviews/", "/literature/")
-            if os.path.exists(path):
+            reviews = get_review_index(target["review_directory"])
+            reviews.refresh()
+            pdf = reviews.pdf_path(path[len(reviews.review_directory) :])
+            if pdf is not None:
                 try:
-                    subprocess.run(["xdg-open", path], check=True)
+                    subprocess.run(["xdg-open", pdf], check=True)
                 except subprocess.CalledProcessError:
-                    eprint(f"Failed to open {path}")
+                    eprint(f"Failed to open {pdf}")
                 return
-        eprint(f"Could not find {path}")
+        eprint(f"Could not find a PDF for {path}")
@@ -1,4 +1,5 @@
 import sys
+import time
 from os.path import abspath, join, pardir
 from denite.base.source import Base
 
@@ -6,13 +7,18 @@ from denite.base.source import Base
 sys.path.append(
     abspath(join(__file__, pardir, pardir, pardir, pardir, pardir, "python"))
 )
-from citation_vim.utils import read_cache, write_cache, is_current
-from citation_vim.item import Item
+from citation_vim import stats
+from citation_vim.context_loader import DEFAULTS
+from citation_vim.item import get_renderer
+from citation_vim.library import get_library
+from citation_vim.reviews import get_review_index
+from citation_vim.search import SEARCH_FIELDS
 
 sub_sources = [
     "abstract",
     "author",
     "collection",
+    "collection_list",
     "combined",
     "date",
     "doi",
@@ -27,7 +33,9 @@ sub_sources = [
     "notes",
     "pages",
     "publisher",
+    "reviewed",
     "tags",
+    "tag_list",
     "title",
     "type",
     "url",
@@ -35,8 +43,12 @@ sub_sources = [
     "zotero_key",
 ]
 
-key_title_banned_regex = r"\b(a|an|the|some|from|on|in|to|of|do|with|der|die|das|ein|eine|einer|eines|einem|einen|un|une|la|le|l|el|las|los|al|uno|una|unos|unas|de|des|del|d)\W"
-key_clean_regex = "[^A-Za-z0-9\!\$\&\*\+\-\.\/\:\;\<\>\?\[\]\^\_\`\|]+"
+# Sub-sources of free text, their candidates keep the item and the kind reads
+# the text from the cache when an action needs it
+TEXT_FIELDS = frozenset(["abstract", "combined", "notes"])
+
+# Sub-sources matcher_citation can filter through the search index
+INDEXED_FIELDS = frozenset(field for field, _ in SEARCH_FIELDS)
 
 
 class Source(Base):
@@ -49,24 +61,23 @@ class Source(Base):
         self.description = "search citation collection"
         self.kind = "citation_collection"
 
-        self.matchers = ["matcher_fuzzy"]
+        self.matchers = ["matcher_citation"]
+        self.sorters = ["sorter_citation"]
         self.is_public_context = True
 
         self.sub_sources = sub_sources
-        self.__cache = False
-        self.__cache_file = None
-        self._parser = None
+        self._library = None
+        self._reviews = None
+        self._stream = None
 
         self.vars = {
-            "cache_path": "",
-            "mode": "bibtex",
             "collection": "",
-            "bibtex_file": "bibtex.bib",
+            "sort": "file",
             "reverse_order": True,
-            "et_al_limit": 5,
-            "key_clean_regex": key_clean_regex,
-            "key_title_banned_regex": key_title_banned_regex,
-            "key_format": "",
+            "batch_size": 1000,
+            "match_limit": 300,
+            "stats": 0,
+            "stats_log": 0,
             "key_outer_prefix": "[",
             "key_inner_prefix": "@",
             "key_suffix": "]",
@@ -84,40 +95,42 @@ class Source(Base):
             "searchkeys": [],
             "review_directory": "",
         }
+        self.vars.update(DEFAULTS)
 
     def on_init(self, context):
         if len(context["args"]) >= 1:
             context["__source"] = "source_field"
             context["__field"] = context["args"].pop(0)
-            self._set_mode(context)
+            # The rest names a tag or collection, which may contain colons
+            context["__label"] = ":".join(context["args"])
+            del context["args"][:]
         else:
             context["__source"] = "sub_sources"
 
+        start = time.monotonic()
         from citation_vim.context_loader import ContextLoader
 
         self.vars.update(ContextLoader(self.vim).context)
-        self.__cache_file = join(self.vars["cache_path"], "citation_vim_cache")
-
-    def _set_mode(self, context):
-        """Set up bibtex or zotero mode"""
-        # Enable cache
-        self._enable_cache()
-        # Get parser
-        from citation_vim.bibtex.parser import BibtexParser
-
-        self._parser = BibtexParser(self.vars)
-
-    def _enable_cache(self):
-        self.__cache = True
-        self.__cache_file = join(self.vars["cache_path"], "citation_vim_cache")
+        # Timed by hand, stats may only be enabled by the context just loaded
+        self._configure_stats()
+        stats.record("context", time.monotonic() - start)
+        self._library = get_library(self.vars)
+        self._reviews = get_review_index(self.vars["review_directory"])
+        # Read by matcher_citation and sorter_citation
+        context["__library"] = self._library
+        context["__match_limit"] = self.vars["match_limit"]
+
+    def _configure_stats(self):
+        log = None
+        if self.vars["stats_log"] and self.vars["cache_path"]:
+            log = join(self.vars["cache_path"], "citation_vim_stats.jsonl")
+        stats.configure(self.vars["stats"] or self.vars["stats_log"], log)
 
     def _get_searchkeys(self, context):
         if len(context["args"]) > 0:
             self.vars["searchkeys"] = context["args"].pop(0)
-            self.__cache = False
         else:
             self.vars["searchkeys"] = []
-            self._enable_cache()
 
     def _gather_sub_sources(self):
         # Generate candidates and return it
@@ -132,12 +145,44 @@ class Source(Base):
         return candidates
 
     def _gather_items(self, context):
-        candidates = []
+        """
+        Returns candidates for one field of the items. They are memoized in
+        the resident library, per field and description settings.
+        """
+        field = context["__field"]
+        # Update vars with source field
+        if field in ["key_inner", "duplicate_keys", "collection"]:
+            self.vars["source_field"] = "key"
+        else:
+            self.vars["source_field"] = field
+        key = (
+            "items",
+            field,
+            context["__label"],
+            self.vars["collection"],
+            self.vars["sort"],
+            self.vars["reverse_order"],
+            self.vars["desc_format"],
+            tuple(self.vars["desc_fields"]),
+            self.vars["wrap_chars"],
+            self.vars["key_outer_prefix"],
+            self.vars["key_inner_prefix"],
+            self.vars["key_suffix"],
+        )
+        with stats.timer("gather_items"):
+            candidates = self._library.memo(
+                key, lambda items: list(self._iter_items(context, items))
+            )
+        return list(candidates)
 
+    def _iter_items(self, context, items):
         if context["__field"] == "duplicate_keys":
-            items = self._get_duplicate_key(context)
-        else:
-            items = self._get_items(context)
+            yield from self._iter_duplicates(items)
+            return
+        if context["__field"] in ["tag_list", "collection_list"]:
+            yield from self._iter_labels(context["__field"])
+            return
+        indexes = self._get_indexes(context, items)
 
         if context["__field"] == "key":
             text = (
@@ -156,90 +201,178 @@ class Source(Base):
         else:
             file_url = "file"
 
-        # Update vars with source field
-        self.vars["source_field"] = context["__field"]
-
-        # Retirn items
-        for item in items:
-            if (
-                not self.vars["collection"]
-                or self.vars["collection"] in item.collections
-            ):
-                candidate = {
-                    "word": item.describe(self.vars),
-                    "action__text": text.format(getattr(item, context["__field"])),
-                    "action__path": getattr(item, file_url).replace("-", "_"),
-                    "action__command": self._set_message(item.combined),
-                }
-                candidates.append(candidate)
-        return candidates
-
-    def _set_message(self, message):
-        return "echo {}".format(message)
-
-    def _get_duplicate_keys(self, context):
+        source_field = self.vars["source_field"]
+        describe = get_renderer(self.vars)
+        # The search index only holds some fields, the others are matched
+        # on the description, which shows the field
+        searchable = source_field in INDEXED_FIELDS
+        for index in indexes:
+            item = items[index]
+            candidate = {
+                "word": describe(item),
+                "action__path": getattr(item, file_url).replace("-", "_"),
+            }
+            if searchable:
+                candidate["citation__index"] = index
+            if source_field in TEXT_FIELDS:
+                candidate["citation__item"] = item
+                candidate["citation__field"] = source_field
+            else:
+                candidate["action__text"] = text.format(getattr(item, source_field))
+            yield candidate
+
+    def _get_indexes(self, context, items):
         """
-        Returns an array of collections.
+        Returns the indexes of the items to list, in display order. Tag and
+        collection filters are looked up in the label index of the library,
+        the order in the sort keys it caches.
         """
-        self.vars["collection"] = ""
-        context["__field"] = "key"
-        self.__cache = False
-
-        # Get items
-        items = self._get_items(context)
-
-        # Filter itesm for duplicate keys
-        items.sort(key=lambda item: item.key)
-        last_item = Item()
-        last_item.key = ""
-        filtered_items = []
-        for item in items:
-            if last_item.key == item.key:
-                filtered_items.append(item)
-            last_item = item
-        return filtered_items
-
-    def _get_items(self, context):
+        filters = []
+        if context["__label"] and context["__field"] == "tags":
+            filters.append(self._library.labelled("tags", context["__label"]))
+        elif context["__label"] and context["__field"] == "collection":
+            filters.append(self._library.labelled("collections", context["__label"]))
+        if self.vars["collection"]:
+            filters.append(
+                self._library.labelled("collections", self.vars["collection"])
+            )
+        indexes = self._library.order(self.vars["sort"])
+        if filters:
+            selected = set(filters[0]).intersection(*filters[1:])
+            if self.vars["sort"] == "file":
+                indexes = sorted(selected)
+            else:
+                indexes = [index for index in indexes if index in selected]
+        if self._is_reversed():
+            indexes = reversed(indexes)
+        return indexes
+
+    def _is_reversed(self):
+        # Sort modes list the newest or first alphabetically at the top already
+        return self.vars["reverse_order"] and self.vars["sort"] == "file"
+
+    def _iter_labels(self, field):
         """
-        Returns items from cache or parser
+        Yields a candidate for each tag or collection with its number of
+        items, narrowing to those items when chosen.
         """
-        if self.__cache and self._is_cached():
-            return read_cache(self.__cache_file)
-        if self._parser is None:
-            self._set_mode(context)
-        items = self._parser.load()
-        if self.vars["reverse_order"]:
-            items.reverse()
-        if self.__cache:
-            write_cache(self.__cache_file, items)
-        return items
-
-    def _is_cached(self):
+        kind, sub_source = {
+            "tag_list": ("tags", "tags"),
+            "collection_list": ("collections", "collection"),
+        }[field]
+        counts = self._library.label_counts(kind)
+        for name, count in sorted(counts.items(), key=lambda i: (-i[1], i[0])):
+            yield {
+                "word": "{} ({})".format(name, count),
+                "action__text": name,
+                "action__sources": [
+                    {"name": "citation_collection", "args": [sub_source, name]}
+                ],
+                "nick": "",
+            }
+
+    def _iter_duplicates(self, items):
         """
-        Returns boolean based on cache and target file dates
+        Yields a candidate for each entry of each group of duplicates, the
+        entries of a group labelled with what they share.
         """
-        file_path = self.vars["bibtex_file"]
-        return is_current(file_path, self.__cache_file)
+        describe = get_renderer(self.vars)
+        for kind, value, indexes in self._library.duplicate_groups():
+            label = "{}({}) {}∶ ".format(kind, len(indexes), value)
+            for index in indexes:
+                item = items[index]
+                yield {
+                    "word": label + describe(item),
+                    "action__text": item.key,
+                    "action__path": item.file.replace("-", "_"),
+                    "citation__index": index,
+                }
 
     def gather_candidates(self, context):
         """
-        Returns an array of collections.
+        Returns an array of collections. While the library is loading they
+        are streamed in batches: Denite calls this again with the "async"
+        event until is_async is unset, and gets the next batch.
         """
-        candidates = []
-        for item in self._get_items(context):
-            candidates.append(
-                {
-                    "word": f"[@{item.key}] | {item.nick} | {item.title}",
-                    "title": f"{item.title}",
-                    "nick": f"{item.nick}",
-                    "action__text": item.key,
-                    "action__path": self.vars["review_directory"]
-                    + f"{item.nick or item.key}.md".replace("-", "_"),
-                    "review_directory": self.vars["review_directory"],
-                }
-            )
+        if self._stream is not None:
+            return self._take_stream(context)
+        if context["__source"] == "source_field":
+            context["is_async"] = False
+            if context["__field"] == "reviewed":
+                return self._gather_reviewed()
+            return self._gather_items(context)
+        with stats.timer("gather_candidates"):
+            candidates = self._library.peek(self._candidates_key())
+            if candidates is not None:
+                self._reviews.annotate(candidates)
+        if candidates is not None:
+            context["is_async"] = False
+            stats.flush("open")
+            return list(candidates)
+        self._stream = self._library.stream(
+            self._candidates_key(), self._iter_candidates, self.vars["batch_size"]
+        )
+        context["is_async"] = True
+        return self._take_stream(context)
+
+    def _candidates_key(self):
+        return (
+            "candidates",
+            self.vars["review_directory"],
+            self.vars["sort"],
+            self.vars["reverse_order"],
+        )
+
+    def _gather_reviewed(self):
+        """
+        Returns the candidates of entries that already have a review.
+        """
+        candidates = self._library.memo(
+            self._candidates_key(), lambda items: list(self._iter_candidates(items))
+        )
+        self._reviews.annotate(candidates)
+        return [candidate for candidate in candidates if candidate["citation__review"]]
+
+    def _take_stream(self, context):
+        candidates, done = self._stream.take()
+        self._reviews.mark(candidates)
+        context["is_async"] = not done
+        if done:
+            self._stream = None
+            stats.flush("load")
+            self._report_duplicates(context)
         return candidates
 
+    def _report_duplicates(self, context):
+        duplicates = self._library.duplicates
+        if duplicates:
+            self.print_message(
+                context,
+                "{} keys are defined in more than one bibtex file: {}".format(
+                    len(duplicates), ", ".join(sorted(duplicates)[:10])
+                ),
+            )
+
+    def on_close(self, context):
+        if self._stream is not None:
+            self._stream.cancel()
+            self._stream = None
+
+    def _iter_candidates(self, items):
+        indexes = self._library.order(self.vars["sort"])
+        for index in reversed(indexes) if self._is_reversed() else indexes:
+            item = items[index]
+            yield {
+                "word": f"[@{item.key}] | {item.nick} | {item.title}",
+                "title": f"{item.title}",
+                "nick": f"{item.nick}",
+                "action__text": item.key,
+                "action__path": self.vars["review_directory"]
+                + f"{item.nick or item.key}.md".replace("-", "_"),
+                "review_directory": self.vars["review_directory"],
+                "citation__index": index,
+            }
+
     def _set_collection(self, collection):
         return "call denite#custom#var('citation', 'collection', '{}')".format(
             collection